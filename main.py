@@ -2,7 +2,10 @@ import os
 import sys
 import threading
 import signal
+import queue
+import atexit
 import logging
+import logging.handlers
 import traceback
 from dotenv import load_dotenv
 
@@ -24,6 +27,14 @@ logging.basicConfig(
     force=True
 )
 
+# Move log I/O off the caller threads (WS callbacks, engine loop): root only enqueues records,
+# a listener thread formats and writes them through the real handlers
+_root_logger = logging.getLogger()
+_log_listener = logging.handlers.QueueListener(queue.SimpleQueue(), *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [logging.handlers.QueueHandler(_log_listener.queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 print("[MAIN] Starting Multi-Strategy Trading Engine (Refactored)...")
 print(" VERIFYING STDOUT: Logs should appear here.", flush=True)
 
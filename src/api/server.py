@@ -195,8 +195,8 @@ def save_token():
     
     if token:
         try:
-            with open('.fyers_token', 'w') as f:
-                f.write(token)
+            from src.brokers.fyers_auto_login import atomic_write
+            atomic_write('.fyers_token', token)
             
             db = _get_db()
             if db and db.connected:
@@ -206,6 +206,8 @@ def save_token():
                         {"$set": {"access_token": token}},
                         upsert=True
                     )
+                    # Brokers read the doc through a memoized get_fyers_session
+                    db.invalidate_fyers_session()
                 except Exception as e:
                     print(f" [API] DB token save failed: {e}")
             
@@ -73,8 +73,8 @@ def fetch_data(symbol, start_date, end_date, interval='1m'):
             "symbol": symbol,
             "resolution": resolution,
             "date_format": "1",
-            "range_from": current_start.strftime("%Y-%m-%d"),
-            "range_to": current_end.strftime("%Y-%m-%d"),
+            "range_from": f"{current_start.year:04d}-{current_start.month:02d}-{current_start.day:02d}",
+            "range_to": f"{current_end.year:04d}-{current_end.month:02d}-{current_end.day:02d}",
             "cont_flag": "1"
         }
         
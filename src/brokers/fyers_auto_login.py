@@ -30,6 +30,16 @@ logger = logging.getLogger("FyersAutoLogin")
 API_BASE = "https://api-t2.fyers.in/vagator/v2"
 TOKEN_API = "https://api-t1.fyers.in/api/v3/token"
 
+def atomic_write(path, data):
+    """
+    Write a token file via tmp + os.replace so a crash never leaves it truncated.
+    No fsync: a lost token is recoverable via refresh, a half-written one is not.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
 def generate_totp(secret):
     """Generate TOTP code from secret"""
     try:
@@ -375,8 +385,7 @@ def _save_tokens(access_token, refresh_token, db_handler=None):
     """Helper function to save tokens to file and MongoDB."""
     # Save to file
     try:
-        with open('.fyers_token', 'w') as f:
-            f.write(access_token)
+        atomic_write('.fyers_token', access_token)
         logger.info(" Token saved to .fyers_token")
     except Exception as e:
         logger.warning(f"Could not save token to file: {e}")
@@ -393,6 +402,9 @@ def _save_tokens(access_token, refresh_token, db_handler=None):
                 }},
                 upsert=True
             )
+            invalidate = getattr(db_handler, 'invalidate_fyers_session', None)
+            if invalidate:
+                invalidate()
             logger.info(" Token saved to MongoDB")
         except Exception as e:
             logger.warning(f"Could not save token to MongoDB: {e}")
@@ -466,8 +478,7 @@ def validate_and_refresh_token(db_handler=None):
         
         # Save to file (for persistence)
         try:
-            with open('.fyers_token', 'w') as f:
-                f.write(access_token)
+            atomic_write('.fyers_token', access_token)
             logger.info(" Token saved to .fyers_token")
         except Exception as e:
             logger.warning(f"Could not save token to file: {e}")
@@ -484,6 +495,9 @@ def validate_and_refresh_token(db_handler=None):
                     }},
                     upsert=True
                 )
+                invalidate = getattr(db_handler, 'invalidate_fyers_session', None)
+                if invalidate:
+                    invalidate()
                 logger.info(" Token saved to MongoDB")
             except Exception as e:
                 logger.warning(f"Could not save token to MongoDB: {e}")
@@ -4,15 +4,25 @@ Connects to Fyers API v3 for LIVE Nifty data and option chain
 """
 
 from fyers_apiv3 import fyersModel
-import pandas as pd
 import os
+import sys
+import asyncio
 import logging
-from datetime import datetime, timedelta
-import pyotp
+import threading
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+from datetime import datetime, timedelta, timezone
 import json
 import base64
 import time
-import jwt
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.utils.date_utils import get_next_nifty_expiry
 
 # Import auto-login module
 try:
@@ -20,7 +30,325 @@ try:
 except ImportError:
     import fyers_auto_login
 
+# NIFTY weeklies are nominally Tuesday (2025+) or Thursday (historical), but NSE moves
+# an expiry to the previous trading day on holidays, so any weekday can be an expiry
+VALID_EXPIRY_WEEKDAYS = {0, 1, 2, 3, 4}
+VALID_OPTION_TYPES = {'CE', 'PE'}
+# Response codes meaning the token was rejected (-16 auth failed, -17 expired, plus raw HTTP
+# statuses the SDK passes through); the SDK returns these as error dicts, it doesn't raise
+AUTH_ERROR_CODES = frozenset({-16, -17, 401, 403})
+_MONTH_CODES = {'O': 10, 'N': 11, 'D': 12}
+
+@lru_cache(maxsize=256)
+def _is_valid_expiry(expiry_date):
+    """Check a Fyers expiry code (YYMdd weekly or YYMMM monthly) is a real trading-weekday date"""
+    if not expiry_date:
+        return False
+    expiry_date = str(expiry_date)
+    if len(expiry_date) != 5:
+        return False
+    if expiry_date[2:].isalpha():
+        return True  # Monthly contract, e.g. 26JAN
+    try:
+        m_code = expiry_date[2]
+        month = _MONTH_CODES.get(m_code) or int(m_code)
+        expiry = datetime(2000 + int(expiry_date[:2]), month, int(expiry_date[3:]))
+    except ValueError:
+        return False
+    return expiry.weekday() in VALID_EXPIRY_WEEKDAYS
+
+# One token-persistence worker for the process; brokers rebuilt by the engine share it
+_PERSIST_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fyers_persist")
+atexit.register(_PERSIST_POOL.shutdown, wait=True)
+
+def _build_http_session():
+    """Pooled keep-alive HTTP session shared by every FyersModel in the process"""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),  # never replay order POSTs
+        raise_on_status=False  # hand the last 429/5xx back to the SDK's own error handling
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+_HTTP_SESSION = _build_http_session()
+
+class _PooledRequests:
+    """
+    Stand-in for the `requests` module inside fyersModel. SDK 3.0.x sends every
+    REST call through module-level requests.get/post/..., so those verbs are
+    routed to _HTTP_SESSION; everything else (exceptions etc.) is the real module.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def get(self, *args, **kwargs):
+        return self._session.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._session.post(*args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self._session.put(*args, **kwargs)
+
+    def patch(self, *args, **kwargs):
+        return self._session.patch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._session.delete(*args, **kwargs)
+
+if getattr(fyersModel, 'requests', None) is requests:
+    fyersModel.requests = _PooledRequests(_HTTP_SESSION)
+
+def _attach_http_session(api):
+    """
+    Route a FyersModel's REST calls through _HTTP_SESSION; True if they now do.
+    SDK >= 3.1 keeps a Session on api.service, 3.0.x uses the module patch above.
+    """
+    service = getattr(api, 'service', None)
+    if isinstance(getattr(service, 'session', None), requests.Session):
+        service.session = _HTTP_SESSION
+        return True
+    return isinstance(getattr(fyersModel, 'requests', None), _PooledRequests)
+
+def _read_file(path):
+    """Stripped file contents, or None if missing/empty (one open, no exists() race)"""
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _file_mtime_ns(path):
+    """st_mtime_ns of path, or None if it doesn't exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class _TokenCache:
+    """
+    Process-wide cache of Fyers tokens and their decoded expiry.
+    Env vars take precedence; a token file is re-read only when its mtime
+    changes, so writers that bypass _persist_tokens are still picked up.
+    """
+    _lock = threading.Lock()
+    _SOURCES = {
+        'access': ('FYERS_ACCESS_TOKEN', '.fyers_token'),
+        'refresh': ('FYERS_REFRESH_TOKEN', '.fyers_refresh_token'),
+    }
+    _tokens = {}  # kind -> (token file mtime_ns when cached, token)
+    _expiry = {}  # token -> decoded expiry
+
+    @classmethod
+    def _get(cls, kind):
+        env_key, path = cls._SOURCES[kind]
+        token = os.getenv(env_key)
+        if token:
+            return token
+        mtime = _file_mtime_ns(path)  # one stat per call instead of an open + read
+        with cls._lock:
+            cached = cls._tokens.get(kind)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            token = _read_file(path) if mtime is not None else None
+            if token is None:
+                # No file (or empty): fall back to an in-memory token, never cache the miss
+                return cached[1] if cached else None
+            cls._tokens[kind] = (mtime, token)
+            return token
+
+    @classmethod
+    def _set(cls, kind, token):
+        # Tied to the file as it is now; a later write to the file takes over
+        mtime = _file_mtime_ns(cls._SOURCES[kind][1])
+        with cls._lock:
+            cls._tokens[kind] = (mtime, token)
+
+    @classmethod
+    def get_access(cls):
+        return cls._get('access')
+
+    @classmethod
+    def get_refresh(cls):
+        return cls._get('refresh')
+
+    @classmethod
+    def set_access(cls, token):
+        cls._set('access', token)
+
+    @classmethod
+    def set_refresh(cls, token):
+        cls._set('refresh', token)
+
+    @classmethod
+    def get_expiry(cls, token):
+        return cls._expiry.get(token)
+
+    @classmethod
+    def set_expiry(cls, token, expiry):
+        with cls._lock:
+            cls._expiry[token] = expiry
+
+class _CachedAccess:
+    """Priority 1a: access token from env/token file, trusted while its JWT is fresh"""
+
+    @staticmethod
+    def try_connect(broker):
+        broker.logger.info(" Priority 1: Check Token Persistence")
+        access_token = _TokenCache.get_access()
+        if not access_token:
+            return False
+        
+        broker._use_token(access_token)
+        
+        # Decode the JWT locally; only probe the API if expiry is unknown
+        access_expiry = broker._get_token_expiry(access_token)
+        if broker._token_is_fresh(access_token):
+            broker.connected = True
+            broker.logger.info(f" Connected to Fyers API (using existing token, expires {access_expiry.strftime('%Y-%m-%d %H:%M UTC')})")
+            return True
+        if access_expiry:
+            broker.logger.warning(f" Access token expired at {access_expiry.strftime('%Y-%m-%d %H:%M UTC')}")
+            return False
+        
+        try:
+            test_response = broker.api.get_profile()
+            if test_response.get('s') == 'ok':
+                broker.connected = True
+                broker.logger.info(f" Connected to Fyers API (using existing token)")
+                return True
+            broker.logger.warning(f" Access token invalid: {test_response}")
+        except Exception as e:
+            broker.logger.warning(f" Access token expired or error: {e}")
+        return False
+
+class _RefreshToken:
+    """Priority 1b: mint a new access token from the saved refresh token"""
+
+    @staticmethod
+    def try_connect(broker):
+        if not broker.refresh_token:
+            return False
+        
+        # Check if refresh token is expired before attempting refresh
+        refresh_expiry = broker._get_token_expiry(broker.refresh_token)
+        if refresh_expiry:
+            time_until_expiry = (refresh_expiry - datetime.now(timezone.utc)).total_seconds()
+            if time_until_expiry <= 0:
+                broker.logger.error(" Refresh token has EXPIRED")
+                broker.logger.error(f"   Expired on: {refresh_expiry.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+                broker._send_token_expiry_alert("refresh", refresh_expiry, expired=True)
+                return False
+            
+            days_until_expiry = time_until_expiry / 86400
+            broker.logger.info(f" Refresh token valid for {days_until_expiry:.1f} more days")
+            
+            # Proactive alert if refresh token expires soon (< 2 days)
+            if days_until_expiry < 2:
+                broker._send_token_expiry_alert("refresh", refresh_expiry, expired=False)
+            broker.logger.info(" Attempting token refresh using refresh_token...")
+        else:
+            broker.logger.info(" Attempting token refresh using refresh_token... (No expiry check)")
+        
+        new_token = broker._refresh_access_token(broker.app_id, broker.refresh_token)
+        if not new_token:
+            broker.logger.warning(" Refresh token API call failed")
+            return False
+        
+        broker._use_token(new_token)
+        
+        # A freshly minted JWT with a future exp is trusted as-is; probe with
+        # retries only if it can't be decoded
+        if not broker._token_is_fresh(new_token, skew=30) and not broker._verify_token_sync():
+            return False
+        broker.connected = True
+        broker.logger.info(" Connected using refreshed token!")
+        broker._persist_tokens(broker.access_token, broker.refresh_token)
+        return True
+
+class _MongoToken:
+    """Priority 2: access token persisted to MongoDB by another instance"""
+
+    @staticmethod
+    def try_connect(broker):
+        broker.logger.info(" Priority 2: Check MongoDB Token")
+        if not (broker.db_handler and broker.db_handler.connected):
+            return False
+        try:
+            get_session = getattr(broker.db_handler, 'get_fyers_session', None)
+            if get_session:
+                conf = get_session()
+            else:
+                conf = broker.db_handler.db["system_config"].find_one({"_id": "fyers_session"})
+            if conf and conf.get('access_token'):
+                broker._use_token(conf['access_token'])
+                test_response = broker.api.get_profile()
+                if test_response.get('s') == 'ok':
+                    broker.connected = True
+                    broker.logger.info(" Connected using MongoDB token")
+                    return True
+        except Exception as e:
+            broker.logger.warning(f"MongoDB token load failed: {e}")
+        return False
+
+class _FullLogin:
+    """Priority 3: full TOTP auto-login as final fallback"""
+
+    @staticmethod
+    def try_connect(broker):
+        broker.logger.info(" Priority 3: Attempting full auto-login...")
+        try:
+            new_access_token, new_refresh_token = fyers_auto_login.auto_login()
+            if not new_access_token:
+                broker.logger.warning(" Auto-login returned no token")
+                return False
+            
+            broker.refresh_token = new_refresh_token
+            broker._use_token(new_access_token)
+            test_response = broker.api.get_profile()
+            if test_response.get('s') == 'ok':
+                broker.connected = True
+                broker.logger.info(" Connected via auto-login!")
+                broker._persist_tokens(broker.access_token, new_refresh_token)
+                return True
+            broker.logger.warning(f" Auto-login token verification failed: {test_response}")
+        except Exception as e:
+            broker.logger.error(f" Auto-login failed: {e}")
+        return False
+
+_CONNECT_STRATEGIES = (_CachedAccess, _RefreshToken, _MongoToken, _FullLogin)
+
 class FyersBroker:
+    QUOTE_BATCH_SIZE = 50  # Max symbols per Fyers quotes request
+    MAX_TICK_MOVE_PCT = 0.20  # Single-quote index moves beyond this are treated as bad ticks
+    CONFIRM_TICK_PCT = 0.02  # A jump is confirmed by a next quote within this of the suspect one
+    LAST_PRICES_MAXLEN = 1024
+    REFRESH_AT_FRACTION = 0.8  # Rotate the access token after 80% of its remaining life
+    REFRESH_RETRY_SECS = 300
+
+    # Static part of every Fyers order payload; place_order copies it and fills the rest
+    _ORDER_TEMPLATE = MappingProxyType({
+        "productType": "INTRADAY", # or MARGIN/CNC
+        "stopPrice": 0,
+        "validity": "DAY",
+        "disclosedQty": 0,
+        "offlineOrder": False,
+        "stopLoss": 0,
+        "takeProfit": 0,
+    })
+    _SIDE_MAP = {'BUY': 1, 'SELL': -1}
+    _TYPE_MAP = {'LIMIT': 1, 'MARKET': 2}
+
     def __init__(self, logger=None, db_handler=None):
         """
         Initialize Fyers broker connection
@@ -33,10 +361,22 @@ class FyersBroker:
         self.logger = logger or logging.getLogger(__name__)
         self.db_handler = db_handler
         self.api = None
+        self._api_cache_key = None  # (app_id, token) self.api was built for
+        self.app_id = None
+        self._async_session = None  # aiohttp session for the async quote path (one per event loop)
+        self._http_session = _HTTP_SESSION  # Shared; survives token refresh / FyersModel rebuilds
+        self._http_pooled = False  # True once self.api's REST calls go through _http_session
         self.connected = False
         self.access_token = None
         self.refresh_token = None
-        self._last_prices = {}  # Cache for last successful prices to filter bad ticks
+        self._last_prices = OrderedDict()  # Cache for last successful prices to filter bad ticks
+        self._suspect_ticks = {}  # Symbol -> last quote rejected as a spike
+        self._warned_expiries = set()  # Invalid expiries already logged (one warning each)
+        self.last_auth_error = None  # Code of the last token-rejected response; cleared by any ok response
+        
+        # Proactive token rotation; the lock keeps connect() and the timer from racing
+        self._refresh_lock = threading.Lock()
+        self._refresh_timer = None
         
         # Nifty symbol on Fyers
         self.NIFTY_SYMBOL = "NSE:NIFTY50-INDEX"
@@ -46,15 +386,36 @@ class FyersBroker:
     
     def _get_token_expiry(self, token):
         """Extract expiry from JWT access token"""
+        cached = _TokenCache.get_expiry(token)
+        if cached:
+            return cached
         try:
-            # Decode without verification to access claims
-            decoded = jwt.decode(token, options={"verify_signature": False})
+            # Only the exp claim is needed and the signature isn't checked,
+            # so decode the payload segment directly
+            payload = token.split('.', 2)[1]
+            decoded = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
             if 'exp' in decoded:
-                return datetime.utcfromtimestamp(decoded['exp'])
+                expiry = datetime.fromtimestamp(decoded['exp'], tz=timezone.utc)
+                _TokenCache.set_expiry(token, expiry)
+                return expiry
         except Exception as e:
             self.logger.debug(f"Could not extract token expiry: {e}")
         return None
 
+    def _token_is_fresh(self, token, skew=60):
+        """True if the JWT decodes and expires more than `skew` seconds from now"""
+        expiry = self._get_token_expiry(token) if token else None
+        if not expiry:
+            return False
+        return (expiry - datetime.now(timezone.utc)).total_seconds() > skew
+
+    def uses_pooled_http(self):
+        """True if this broker's REST calls go through the shared keep-alive session"""
+        if self.api is not None:
+            return self._http_pooled
+        # Not connected yet: the module-level SDK patch is what the first FyersModel will use
+        return isinstance(getattr(fyersModel, 'requests', None), _PooledRequests)
+
     def _send_token_expiry_alert(self, token_type, expiry, expired=False):
         """Log or alert on token expiry"""
         msg = f"Fyers {token_type} token {'EXPIRED' if expired else 'expiring soon'}: {expiry}"
@@ -78,18 +439,183 @@ class FyersBroker:
         
         if new_refresh_token:
             self.refresh_token = new_refresh_token
+            _TokenCache.set_refresh(new_refresh_token)
             # Update env for current session
             os.environ['FYERS_REFRESH_TOKEN'] = new_refresh_token
             # Persist refresh token to file so it survives restarts
             try:
-                with open('.fyers_refresh_token', 'w') as f:
-                    f.write(new_refresh_token)
+                fyers_auto_login.atomic_write('.fyers_refresh_token', new_refresh_token)
                 self.logger.info("Refresh token saved to .fyers_refresh_token")
             except Exception as e:
                 self.logger.warning(f"Could not save refresh token to file: {e}")
             
         return new_access_token
 
+    def _persist_tokens(self, access_token, refresh_token=None, access_expiry=None, refresh_expiry=None):
+        """
+        Save tokens to disk and env immediately; MongoDB write runs on a
+        background thread so connect() doesn't wait on the round-trip.
+        """
+        for token, path, env_key in (
+            (access_token, '.fyers_token', 'FYERS_ACCESS_TOKEN'),
+            (refresh_token, '.fyers_refresh_token', 'FYERS_REFRESH_TOKEN'),
+        ):
+            if not token:
+                continue
+            os.environ[env_key] = token
+            try:
+                fyers_auto_login.atomic_write(path, token)
+            except Exception as e:
+                self.logger.warning(f"Could not save token to {path}: {e}")
+
+        _TokenCache.set_access(access_token)
+        if refresh_token:
+            _TokenCache.set_refresh(refresh_token)
+
+        access_expiry = access_expiry or self._get_token_expiry(access_token)
+        if refresh_token and not refresh_expiry:
+            refresh_expiry = self._get_token_expiry(refresh_token)
+        if access_expiry:
+            self.logger.info(f" Access token expires: {access_expiry.strftime('%Y-%m-%d %H:%M UTC')}")
+        if refresh_expiry:
+            self.logger.info(f" Refresh token expires: {refresh_expiry.strftime('%Y-%m-%d %H:%M UTC')}")
+
+        if self.db_handler and getattr(self.db_handler, 'connected', False):
+            # MongoDB write runs off the connect() path on the shared persist worker
+            _PERSIST_POOL.submit(
+                self._mongo_write_tokens, access_token, refresh_token, access_expiry, refresh_expiry
+            )
+
+    def _mongo_write_tokens(self, access_token, refresh_token, access_expiry, refresh_expiry):
+        """Save token session with expiry metadata to MongoDB"""
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            session = {
+                "access_token": access_token,
+                "access_token_expiry": access_expiry.isoformat() if access_expiry else None,
+                "updated_at": now,
+                "last_refresh_success": now
+            }
+            # Don't clobber a stored refresh token when we only have a new access token
+            if refresh_token:
+                session["refresh_token"] = refresh_token
+                session["refresh_token_expiry"] = refresh_expiry.isoformat() if refresh_expiry else None
+            queue = getattr(self.db_handler, 'queue_session_update', None)
+            if queue:
+                # Coalesced with other brokers' session writes into one bulk_write
+                queue("fyers_session", session)
+                self.logger.info(" Token queued for MongoDB with expiry tracking")
+                return
+            self.db_handler.db["system_config"].update_one(
+                {"_id": "fyers_session"},
+                {"$set": session},
+                upsert=True
+            )
+            invalidate = getattr(self.db_handler, 'invalidate_fyers_session', None)
+            if invalidate:
+                invalidate()
+            self.logger.info(" Token saved to MongoDB with expiry tracking")
+        except Exception as e:
+            self.logger.warning(f"Could not save token to MongoDB: {e}")
+
+    async def _verify_token(self, max_retries=3):
+        """
+        Probe get_profile with jittered exponential backoff (~1s, 2s, 4s).
+        The blocking SDK call runs in the default executor so the event loop stays free.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(max_retries):
+            try:
+                test_response = await loop.run_in_executor(None, self.api.get_profile)
+                if test_response.get('s') == 'ok':
+                    return True
+                self.logger.warning(f" Token verification failed (attempt {attempt + 1}/{max_retries}): {test_response}")
+            except Exception as e:
+                self.logger.warning(f" Token verification error (attempt {attempt + 1}/{max_retries}): {e}")
+            
+            if attempt < max_retries - 1:
+                # Jitter avoids every process re-probing in lockstep after a shared expiry
+                await asyncio.sleep((2 ** attempt) * (0.5 + random.random() * 0.5))
+        
+        self.logger.error(f" Token verification failed after {max_retries} attempts")
+        return False
+
+    def _verify_token_sync(self, max_retries=3):
+        """Run _verify_token from sync code, even when called inside a running event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._verify_token(max_retries))
+        # Already inside a loop (async strategy): run on a helper thread with its own loop
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self._verify_token(max_retries)).result()
+
+    def _schedule_refresh(self, access_token, delay=None):
+        """Arm a daemon timer to rotate the access token at ~80% of its remaining life"""
+        if delay is None:
+            expiry = self._get_token_expiry(access_token)
+            if not expiry or not self.refresh_token:
+                return
+            delay = max(60, (expiry - datetime.now(timezone.utc)).total_seconds() * self.REFRESH_AT_FRACTION)
+        
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+        self.logger.info(f" Next token refresh in {delay / 3600:.1f}h")
+
+    def _background_refresh(self):
+        """Timer callback: refresh and persist tokens off the order-placement path"""
+        with self._refresh_lock:
+            try:
+                new_token = self._refresh_access_token(self.app_id, self.refresh_token)
+                if new_token:
+                    self._use_token(new_token)
+                    self.connected = True
+                    self._persist_tokens(self.access_token, self.refresh_token)
+                    self.logger.info(" Access token rotated in background")
+                    self._schedule_refresh(self.access_token)
+                    return
+                self.logger.warning(" Background token refresh failed")
+            except Exception as e:
+                self.logger.warning(f" Background token refresh error: {e}")
+            # Still have the old token until it expires; try again shortly
+            self._schedule_refresh(self.access_token, delay=self.REFRESH_RETRY_SECS)
+
+    def close(self):
+        """Stop the background token refresh timer and the async quote session"""
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+        session = self._async_session
+        if session is not None and not session.closed and not session._loop.is_closed():
+            if session._loop.is_running():
+                session._loop.call_soon_threadsafe(session._loop.create_task, self.aclose())
+            else:
+                session._loop.run_until_complete(self.aclose())
+
+    def _use_token(self, access_token):
+        """Point the broker at an access token; the Fyers client is rebuilt only when it changes"""
+        self.access_token = access_token
+        self.last_auth_error = None
+        return self._get_api(self.app_id, access_token)
+
+    def _get_api(self, app_id, token):
+        """FyersModel for (app_id, token), reused while the pair is unchanged"""
+        key = (app_id, token)
+        if self.api is None or self._api_cache_key != key:
+            self.api = fyersModel.FyersModel(
+                client_id=app_id,
+                token=token,
+                log_path=""
+            )
+            self._http_pooled = _attach_http_session(self.api)
+            if not self._http_pooled:
+                self.logger.warning(" Fyers SDK transport not recognised; REST calls bypass the pooled session")
+            self._api_cache_key = key
+        return self.api
+
     def connect(self):
         """Connect to Fyers API using credentials or saved token"""
         try:
@@ -101,250 +627,91 @@ class FyersBroker:
             # Standardize App ID suffix
             if len(app_id) == 10:
                 app_id += "-100"
+            self.app_id = app_id
             
-            # Priority 1: Check Environment/Config for Tokens
-            self.logger.info(" Priority 1: Check Token Persistence")
+            # Env first, then token files (read from disk once per process)
+            self.refresh_token = _TokenCache.get_refresh()
             
-            access_token = os.getenv('FYERS_ACCESS_TOKEN')
-            refresh_token = os.getenv('FYERS_REFRESH_TOKEN')
-            self.refresh_token = refresh_token
-            
-            # If no access token in env, try loading from file
-            if not access_token and os.path.exists('.fyers_token'):
-                with open('.fyers_token', 'r') as f:
-                    access_token = f.read().strip()
-            
-            # If no refresh token in env, try loading from file
-            if not refresh_token and os.path.exists('.fyers_refresh_token'):
-                with open('.fyers_refresh_token', 'r') as f:
-                    refresh_token = f.read().strip()
-                    self.refresh_token = refresh_token
-            
-            # Case A: We have an access token, try it
-            if access_token:
-                self.access_token = access_token
-                self.api = fyersModel.FyersModel(
-                    client_id=app_id,
-                    token=self.access_token,
-                    log_path=""
-                )
-                
-                try:
-                    test_response = self.api.get_profile()
-                    if test_response.get('s') == 'ok':
-                        self.connected = True
-                        self.logger.info(f" Connected to Fyers API (using existing token)")
+            # Cheapest source first; each strategy sets self.connected on success
+            with self._refresh_lock:
+                for strategy in _CONNECT_STRATEGIES:
+                    if strategy.try_connect(self):
+                        self._schedule_refresh(self.access_token)
                         return
-                    else:
-                        self.logger.warning(f" Access token invalid: {test_response}")
-                except Exception as e:
-                    self.logger.warning(f" Access token expired or error: {e}")
-
-            # Case B: Access token failed or missing, but we have a refresh token
-            if self.refresh_token:
-                # Check if refresh token is expired before attempting refresh
-                refresh_expiry = self._get_token_expiry(self.refresh_token)
-                if refresh_expiry:
-                    time_until_expiry = (refresh_expiry - datetime.utcnow()).total_seconds()
-                    if time_until_expiry <= 0:
-                        self.logger.error(" Refresh token has EXPIRED")
-                        self.logger.error(f"   Expired on: {refresh_expiry.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-                        self._send_token_expiry_alert("refresh", refresh_expiry, expired=True)
-                        # Skip refresh attempt, go to next fallback
-                    else:
-                        days_until_expiry = time_until_expiry / 86400
-                        self.logger.info(f" Refresh token valid for {days_until_expiry:.1f} more days")
-                        
-                        # Proactive alert if refresh token expires soon (< 2 days)
-                        if days_until_expiry < 2:
-                            self._send_token_expiry_alert("refresh", refresh_expiry, expired=False)
-                        
-                        self.logger.info(" Attempting token refresh using refresh_token...")
-                        new_token = self._refresh_access_token(app_id, self.refresh_token)
-                        if new_token:
-                            self.access_token = new_token
-                            self.api = fyersModel.FyersModel(
-                                client_id=app_id,
-                                token=self.access_token,
-                                log_path=""
-                            )
-                            
-                            # Verify the new token with retry logic
-                            max_retries = 3
-                            for attempt in range(max_retries):
-                                try:
-                                    test_response = self.api.get_profile()
-                                    if test_response.get('s') == 'ok':
-                                        self.connected = True
-                                        self.logger.info(" Connected using refreshed token!")
-                                        
-                                        # Save the new access token to file
-                                        try:
-                                            with open('.fyers_token', 'w') as f:
-                                                f.write(self.access_token)
-                                        except Exception as e:
-                                            self.logger.warning(f"Could not save token to file: {e}")
-                                        
-                                        # Save to environment
-                                        os.environ['FYERS_ACCESS_TOKEN'] = self.access_token
-                                        
-                                        # Save to MongoDB with expiry metadata
-                                        if self.db_handler and hasattr(self.db_handler, 'connected') and self.db_handler.connected:
-                                            try:
-                                                access_expiry = self._get_token_expiry(self.access_token)
-                                                refresh_expiry = self._get_token_expiry(self.refresh_token)
-                                                
-                                                self.db_handler.db["system_config"].update_one(
-                                                    {"_id": "fyers_session"},
-                                                    {"$set": {
-                                                        "access_token": self.access_token,
-                                                        "refresh_token": self.refresh_token,
-                                                        "access_token_expiry": access_expiry.isoformat() if access_expiry else None,
-                                                        "refresh_token_expiry": refresh_expiry.isoformat() if refresh_expiry else None,
-                                                        "updated_at": datetime.utcnow().isoformat(),
-                                                        "last_refresh_success": datetime.utcnow().isoformat()
-                                                    }},
-                                                    upsert=True
-                                                )
-                                                self.logger.info(" Token saved to MongoDB with expiry tracking")
-                                                
-                                                # Log expiry info
-                                                if access_expiry:
-                                                    self.logger.info(f" Access token expires: {access_expiry.strftime('%Y-%m-%d %H:%M UTC')}")
-                                                if refresh_expiry:
-                                                    self.logger.info(f" Refresh token expires: {refresh_expiry.strftime('%Y-%m-%d %H:%M UTC')}")
-                                            except Exception as e:
-                                                self.logger.warning(f"Could not save token to MongoDB: {e}")
-                                        
-                                        return
-                                    else:
-                                        self.logger.warning(f" Token verification failed (attempt {attempt + 1}/{max_retries}): {test_response}")
-                                        if attempt < max_retries - 1:
-                                            time.sleep(2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
-                                except Exception as e:
-                                    self.logger.warning(f" Token verification error (attempt {attempt + 1}/{max_retries}): {e}")
-                                    if attempt < max_retries - 1:
-                                        time.sleep(2 ** attempt)
-                                    else:
-                                        self.logger.error(f" Token verification failed after {max_retries} attempts")
-                        else:
-                            self.logger.warning(" Refresh token API call failed")
-                else:
-                    self.logger.info(" Attempting token refresh using refresh_token... (No expiry check)")
-                    new_token = self._refresh_access_token(app_id, self.refresh_token)
-                    if new_token:
-                        self.access_token = new_token
-                        self.api = fyersModel.FyersModel(
-                            client_id=app_id,
-                            token=self.access_token,
-                            log_path=""
-                        )
-                        
-                        max_retries = 3
-                        for attempt in range(max_retries):
-                            try:
-                                test_response = self.api.get_profile()
-                                if test_response.get('s') == 'ok':
-                                    self.connected = True
-                                    self.logger.info(" Connected using refreshed token!")
-                                    # Save logic (simplified)
-                                    try:
-                                        with open('.fyers_token', 'w') as f:
-                                            f.write(self.access_token)
-                                        os.environ['FYERS_ACCESS_TOKEN'] = self.access_token
-                                    except Exception as e:
-                                        self.logger.warning(f"Could not save refreshed token: {e}")
-                                    return
-                                else:
-                                    if attempt < max_retries - 1: time.sleep(1)
-                            except Exception as e:
-                                self.logger.warning(f"Token verification error (attempt): {e}")
-                                if attempt < max_retries - 1: time.sleep(1)
             
-            # Priority 2: Try to load from MongoDB (Cloud Persistence)
-            # NOTE: Priority 2 was previously re-reading .fyers_token which was already
-            # tried in Priority 1. Skipping redundant file read.
-            self.logger.info(" Priority 2: Check MongoDB Token")
-            if not self.connected and self.db_handler and self.db_handler.connected:
-                try:
-                    conf = self.db_handler.db["system_config"].find_one({"_id": "fyers_session"})
-                    if conf and conf.get('access_token'):
-                        self.access_token = conf['access_token']
-                        self.api = fyersModel.FyersModel(
-                            client_id=app_id,
-                            token=self.access_token,
-                            log_path=""
-                        )
-                        test_response = self.api.get_profile()
-                        if test_response.get('s') == 'ok':
-                            self.connected = True
-                            self.logger.info(" Connected using MongoDB token")
-                            return
-                except Exception as e:
-                    self.logger.warning(f"MongoDB token load failed: {e}")
-            
-            # Priority 3: Full auto-login as final fallback
-            if not self.connected:
-                self.logger.info(" Priority 3: Attempting full auto-login...")
-                try:
-                    new_access_token, new_refresh_token = fyers_auto_login.auto_login()
-                    if new_access_token:
-                        self.access_token = new_access_token
-                        self.refresh_token = new_refresh_token
-                        self.api = fyersModel.FyersModel(
-                            client_id=app_id,
-                            token=self.access_token,
-                            log_path=""
-                        )
-                        test_response = self.api.get_profile()
-                        if test_response.get('s') == 'ok':
-                            self.connected = True
-                            self.logger.info(" Connected via auto-login!")
-                            # Persist tokens
-                            os.environ['FYERS_ACCESS_TOKEN'] = self.access_token
-                            try:
-                                with open('.fyers_token', 'w') as f:
-                                    f.write(self.access_token)
-                            except Exception:
-                                pass
-                            if new_refresh_token:
-                                os.environ['FYERS_REFRESH_TOKEN'] = new_refresh_token
-                                try:
-                                    with open('.fyers_refresh_token', 'w') as f:
-                                        f.write(new_refresh_token)
-                                except Exception:
-                                    pass
-                            return
-                        else:
-                            self.logger.warning(f" Auto-login token verification failed: {test_response}")
-                    else:
-                        self.logger.warning(" Auto-login returned no token")
-                except Exception as e:
-                    self.logger.error(f" Auto-login failed: {e}")
-                
-                self.logger.error(" ALL CONNECTION METHODS FAILED. MANUAL LOGIN REQUIRED.")
+            self.logger.error(" ALL CONNECTION METHODS FAILED. MANUAL LOGIN REQUIRED.")
                 
         except Exception as e:
             self.logger.error(f"Fyers Connect Error: {e}")
 
-    def get_current_price(self, symbol):
-        """Get LATEST price for a symbol"""
+    def _track_auth(self, response):
+        """Record whether the API is rejecting our token; returns the response unchanged"""
+        if isinstance(response, dict):
+            if response.get('s') == 'ok':
+                self.last_auth_error = None
+            elif response.get('code') in AUTH_ERROR_CODES:
+                self.last_auth_error = response.get('code')
+        return response
+
+    def get_current_prices(self, symbols):
+        """
+        Get LATEST prices for many symbols, one quotes call per 50-symbol batch.
+        Returns {symbol: ltp}; symbols without a quote are omitted.
+        """
         if not self.connected or not self.api:
-            return None
-            
-        try:
-            # Fyers quotes expects comma separated string
-            data = {"symbols": symbol}
-            response = self.api.quotes(data=data)
+            return {}
             
-            if response.get('s') == 'ok' and 'd' in response:
-                return response['d'][0]['v']['lp'] # Last Traded Price
-            else:
-                self.logger.warning(f"Quote failed for {symbol}: {response}")
-                return None
-        except Exception as e:
-            self.logger.error(f"Get Price Error {symbol}: {e}")
-            return None
+        symbols = list(symbols)
+        prices = {}
+        for i in range(0, len(symbols), self.QUOTE_BATCH_SIZE):
+            chunk = symbols[i:i + self.QUOTE_BATCH_SIZE]
+            try:
+                # Fyers quotes expects comma separated string
+                response = self._track_auth(self.api.quotes(data={"symbols": ",".join(chunk)}))
+                
+                if response.get('s') == 'ok' and 'd' in response:
+                    for item in response['d']:
+                        name = item.get('n')
+                        ltp = self._filter_tick(name, item.get('v', {}).get('lp')) # Last Traded Price
+                        if ltp is not None:
+                            prices[name] = ltp
+                else:
+                    self.logger.warning(f"Quote failed for {','.join(chunk)}: {response}")
+            except Exception as e:
+                self.logger.error(f"Get Price Error {','.join(chunk)}: {e}")
+        return prices
+
+    def _filter_tick(self, symbol, ltp):
+        """
+        Drop zero/garbage quotes, falling back to the last good price. Index
+        quotes also get a spike filter: a jump is accepted once the next quote
+        lands near the rejected one. Option premiums legitimately move more
+        than MAX_TICK_MOVE_PCT between polls, so they are never held back.
+        """
+        prev = self._last_prices.get(symbol)
+        if not ltp or ltp <= 0:
+            return prev
+        
+        if prev and symbol and symbol.endswith('-INDEX') and abs(ltp - prev) / prev > self.MAX_TICK_MOVE_PCT:
+            suspect = self._suspect_ticks.get(symbol)
+            if not suspect or abs(ltp - suspect) / suspect > self.CONFIRM_TICK_PCT:
+                self._suspect_ticks[symbol] = ltp
+                self.logger.warning(f"Rejected suspect tick for {symbol}: {prev} -> {ltp}")
+                return prev
+        
+        self._suspect_ticks.pop(symbol, None)
+        self._last_prices[symbol] = ltp
+        self._last_prices.move_to_end(symbol)
+        if len(self._last_prices) > self.LAST_PRICES_MAXLEN:
+            self._last_prices.popitem(last=False)
+        return ltp
+
+    def get_current_price(self, symbol, last_known_price=None):
+        """Get LATEST price for a symbol, falling back to the last good price on API errors"""
+        price = self.get_current_prices([symbol]).get(symbol)
+        if price is None:
+            price = self._last_prices.get(symbol, last_known_price)
+        return price
 
     def get_history(self, symbol, resolution, range_from, range_to, cont_flag="1", date_format="0"):
         """
@@ -364,7 +731,7 @@ class FyersBroker:
                 "cont_flag": cont_flag
             }
             
-            response = self.api.history(data=data)
+            response = self._track_auth(self.api.history(data=data))
             
             if response.get('s') == 'ok':
                 return response
@@ -382,6 +749,10 @@ class FyersBroker:
         """
         if not self.connected:
             return None
+        
+        # Deferred: order-only users of the broker never pay the pandas/numpy import
+        import pandas as pd
+        import numpy as np
             
         try:
             # Calculate range
@@ -403,22 +774,27 @@ class FyersBroker:
                 range_to=to_date
             )
             
-            if response and 'candles' in response:
+            if response and response.get('candles'):
                 candles = response['candles']
-                # Fyers returns [timestamp, open, high, low, close, volume]
-                df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+                # Fyers returns [timestamp, open, high, low, close, volume], oldest first,
+                # so trim before conversion instead of sorting/slicing the DataFrame
+                if len(candles) > limit:
+                    candles = candles[-limit:]
+                arr = np.asarray(candles, dtype=np.float64)
                 
                 # Convert timestamp from epoch to datetime
-                # Handle timezone if needed (Fyers sends IST or UTC?)
                 # Usually Fyers sends epoch in IST/Local
-                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+                timestamps = pd.to_datetime(arr[:, 0].astype('int64'), unit='s', cache=True)
+                df = pd.DataFrame({
+                    'timestamp': timestamps,
+                    'open': arr[:, 1],
+                    'high': arr[:, 2],
+                    'low': arr[:, 3],
+                    'close': arr[:, 4],
+                    'volume': arr[:, 5],
+                })
                 df['datetime'] = df['timestamp'] # Alias
                 
-                # Sort and slice
-                df = df.sort_values('timestamp')
-                if len(df) > limit:
-                    df = df.iloc[-limit:]
-                
                 return df
                 
             return pd.DataFrame()
@@ -427,6 +803,58 @@ class FyersBroker:
             self.logger.error(f"Get Latest Bars Error {symbol}: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _option_symbol(expiry_date, strike, option_type):
+        """Cached, interned symbol string so chain polling skips re-formatting"""
+        return sys.intern(f"NSE:NIFTY{expiry_date}{strike}{option_type}")
+
+    def _build_option_symbol(self, expiry_date, strike, option_type):
+        """Build Fyers option symbol, e.g. NSE:NIFTY2621025500CE"""
+        if not expiry_date:
+            expiry_date = get_next_nifty_expiry()
+        return self._option_symbol(expiry_date, int(strike), option_type)
+
+    def _is_valid_contract(self, strike, option_type, expiry_date):
+        """Reject option contracts that cannot exist before quoting them"""
+        if option_type not in VALID_OPTION_TYPES or int(strike) % 50:
+            self.logger.warning(f"Invalid option contract: {strike}{option_type}")
+            return False
+        if expiry_date and not _is_valid_expiry(expiry_date):
+            # Chain polls ask for dozens of strikes per expiry; warn once, not per contract
+            if expiry_date not in self._warned_expiries:
+                self._warned_expiries.add(expiry_date)
+                self.logger.warning(f"Invalid option expiry: {expiry_date}")
+            return False
+        return True
+
+    def get_atm_straddle(self, symbol=None, expiry_date=None):
+        """
+        Get ATM strike plus CE and PE premiums in a single quotes call.
+        Returns {'strike': atm, 'CE': premium, 'PE': premium} or None.
+        """
+        symbol = symbol or self.NIFTY_SYMBOL
+        spot = self.get_current_price(symbol)
+        if spot is None:
+            self.logger.warning(f"ATM straddle skipped: no spot price for {symbol}")
+            return None
+
+        atm = round(spot / 50) * 50
+        ce_sym = self._build_option_symbol(expiry_date, atm, 'CE')
+        pe_sym = self._build_option_symbol(expiry_date, atm, 'PE')
+
+        try:
+            response = self._track_auth(self.api.quotes(data={"symbols": f"{ce_sym},{pe_sym}"}))
+            if response.get('s') != 'ok' or 'd' not in response:
+                self.logger.warning(f"Straddle quote failed for {atm}: {response}")
+                return None
+
+            prices = {item.get('n'): item.get('v', {}).get('lp') for item in response['d']}
+            return {'strike': atm, 'CE': prices.get(ce_sym), 'PE': prices.get(pe_sym)}
+        except Exception as e:
+            self.logger.error(f"Straddle Quote Error {atm}: {e}")
+            return None
+
     def get_option_chain(self, strike, option_type, expiry_date):
         """
         Get option premium for a specific strike.
@@ -440,7 +868,11 @@ class FyersBroker:
             # Fyers paper broker expects 'exp' to be prepared string like "24208" (YYMDD)
             # symbol = f"NSE:NIFTY{expiry_date}{strike}{option_type}"
             
-            symbol = f"NSE:NIFTY{expiry_date}{strike}{option_type}"
+            # Skip the network call for contracts that cannot exist
+            if not self._is_valid_contract(strike, option_type, expiry_date):
+                return None
+
+            symbol = self._build_option_symbol(expiry_date, strike, option_type)
             
             # Use quotes to get LTP
             price = self.get_current_price(symbol)
@@ -450,6 +882,102 @@ class FyersBroker:
             self.logger.error(f"Option Chain Error: {e}")
             return None
 
+    def _get_async_session(self):
+        """Keep-alive aiohttp session for the running loop (rebuilt if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        session = self._async_session
+        if session is None or session.closed or session._loop is not loop:
+            import aiohttp  # fyers-apiv3 dependency; only needed on the async path
+            session = self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=10),
+            )
+        return session
+
+    async def _quotes_async(self, symbols):
+        """GET /data/quotes over the shared async session (same request as FyersModel.quotes)"""
+        headers = {"Authorization": f"{self.app_id}:{self.access_token}", "version": "3"}
+        url = fyersModel.Config.DATA_API + fyersModel.Config.quotes
+        try:
+            async with self._get_async_session().get(url, params={"symbols": symbols}, headers=headers) as resp:
+                try:
+                    return await resp.json(content_type=None)
+                except ValueError:
+                    return {"s": "error", "code": resp.status, "message": resp.reason}
+        except asyncio.TimeoutError:
+            return {"s": "error", "code": 0, "message": "timeout"}
+
+    async def aclose(self):
+        """Close the async quote session; call from the loop that used it"""
+        session, self._async_session = self._async_session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def get_current_price_async(self, symbol, last_known_price=None):
+        """Async variant of get_current_price (same bad-tick filter and fallback)"""
+        if not self.connected or not self.api:
+            return last_known_price
+        try:
+            response = self._track_auth(await self._quotes_async(symbol))
+            if response.get('s') == 'ok' and response.get('d'):
+                item = response['d'][0]
+                price = self._filter_tick(item.get('n'), item.get('v', {}).get('lp'))
+                if price is not None:
+                    return price
+            else:
+                self.logger.warning(f"Async quote failed for {symbol}: {response}")
+        except Exception as e:
+            self.logger.error(f"Async Get Price Error {symbol}: {e}")
+        return self._last_prices.get(symbol, last_known_price)
+
+    async def get_option_chain_async(self, strike, option_type, expiry_date=None):
+        """Async variant of get_option_chain for use from event-loop callers"""
+        if not self.connected or not self.api:
+            return None
+        if not self._is_valid_contract(strike, option_type, expiry_date):
+            return None
+
+        symbol = self._build_option_symbol(expiry_date, strike, option_type)
+        try:
+            response = self._track_auth(await self._quotes_async(symbol))
+            if response.get('s') == 'ok' and 'd' in response:
+                return response['d'][0]['v']['lp']
+            self.logger.warning(f"Async quote failed for {symbol}: {response}")
+        except Exception as e:
+            self.logger.error(f"Async Option Chain Error {symbol}: {e}")
+        return None
+
+    async def get_option_chains_async(self, contracts, expiry_date=None):
+        """
+        Fetch premiums for many (strike, option_type) pairs concurrently.
+        Returns {(strike, option_type): premium or None}
+        """
+        contracts = list(contracts)
+        results = await asyncio.gather(
+            *[self.get_option_chain_async(strike, otype, expiry_date) for strike, otype in contracts],
+            return_exceptions=True
+        )
+        return {
+            key: (None if isinstance(res, Exception) else res)
+            for key, res in zip(contracts, results)
+        }
+
+    def get_option_chain_batch(self, contracts, expiry_date=None):
+        """
+        Get premiums for many (strike, option_type) pairs of one expiry in a
+        single batched quotes request.
+        Returns {(strike, option_type): premium or None}
+        """
+        symbols = {}
+        for strike, option_type in contracts:
+            if self._is_valid_contract(strike, option_type, expiry_date):
+                symbols[(strike, option_type)] = self._build_option_symbol(expiry_date, strike, option_type)
+            else:
+                symbols[(strike, option_type)] = None
+        
+        prices = self.get_current_prices(sym for sym in symbols.values() if sym)
+        return {key: prices.get(sym) if sym else None for key, sym in symbols.items()}
+
     def place_order(self, symbol, qty, side, order_type='MARKET', price=0.0, product='MIS', instrument=None):
         """
         Place real order on Fyers
@@ -458,30 +986,13 @@ class FyersBroker:
             return {"status": "error", "message": "Not connected"}
             
         try:
-            # Map side
-            # Fyers: 1 => Buy, -1 => Sell
-            side_int = 1 if side.upper() == 'BUY' else -1
-            
-            # Map type
-            # 1 => Limit, 2 => Market, 3 => Stop, 4 => Stop Limit
-            type_int = 2
-            if order_type.upper() == 'LIMIT':
-                type_int = 1
+            # Fyers: 1 => Buy, -1 => Sell; anything but BUY sells, as before
+            side_int = self._SIDE_MAP.get(side) or self._SIDE_MAP.get(side.upper(), -1)
+            # 1 => Limit, 2 => Market; anything but LIMIT goes to market
+            type_int = self._TYPE_MAP.get(order_type) or self._TYPE_MAP.get(order_type.upper(), 2)
             
-            data = {
-                "symbol": symbol,
-                "qty": qty,
-                "type": type_int,
-                "side": side_int,
-                "productType": "INTRADAY", # or MARGIN/CNC
-                "limitPrice": price,
-                "stopPrice": 0,
-                "validity": "DAY",
-                "disclosedQty": 0,
-                "offlineOrder": False,
-                "stopLoss": 0,
-                "takeProfit": 0
-            }
+            data = dict(self._ORDER_TEMPLATE)
+            data.update(symbol=symbol, qty=qty, type=type_int, side=side_int, limitPrice=price)
             
             response = self.api.place_order(data=data)
             
@@ -2,42 +2,89 @@
 Fyers Paper Trading Broker
 Uses LIVE Fyers data for 100% accurate simulation
 """
-from src.brokers.fyers_broker import FyersBroker
+from src.brokers.fyers_broker import FyersBroker, AUTH_ERROR_CODES
+from src.utils.date_utils import get_next_nifty_expiry
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
 import json
+import sys
+import asyncio
 import logging
-import math
+import numpy as np
+import pandas as pd
+import pytz
 import time
 import random
 
+IST = pytz.timezone('Asia/Kolkata')
+
+def _to_paise(amount):
+    """Rupees -> integer paise"""
+    return int(round(amount * 100))
+
+@dataclass(slots=True)
+class PaperPosition:
+    """Open paper position; slotted so PnL loops read fields by offset, not dict lookup"""
+    order_id: str
+    entry_price: float
+    qty: int
+    shares: int
+    spot_entry: float
+    entry_time_ns: int
+    strike: int
+    type: str
+    expiry: str
+    entry_costs: float
+
 class FyersPaperBroker:
+    _SLIPPAGE_SIGN = {'buy': 1.0, 'sell': -1.0}
+
     def __init__(self, logger=None, initial_capital=100000, db_handler=None):
         self.logger = logger or logging.getLogger(__name__)
         
         # Connect to Fyers
         self.fyers = FyersBroker(logger, db_handler=db_handler)
+        # Spot + premium fetches in submit_order ride FyersBroker's pooled keep-alive
+        # session (shared across token refreshes) instead of a fresh TLS handshake each
+        if not self.fyers.uses_pooled_http():
+            self.logger.warning(" Fyers REST calls are not using the pooled keep-alive session")
         
         # Paper trading state
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
-        self.positions = {}
-        self.closed_trades = []
+        self.positions = {}  # (expiry, strike, option_type) -> PaperPosition
+        self._symbol_cache = {}  # position key -> interned display symbol
+        self._symbol_keys = {}  # display symbol -> position key (legacy string lookups)
+        # Ring buffer of (symbol, qty, entry_price, exit_price, pnl, exit_time_ns)
+        self.closed_trades = deque(maxlen=10_000)
         self.order_id_counter = 1
         
         # Real-world Brokerage & Taxes
         self.BROKERAGE_PER_ORDER = 20.0
         self.TAX_ESTIMATE_PCT = 0.0006  # 0.06% for STT, SEBI, GST etc.
+        # Cost model is linear: costs = brokerage + value * coef
+        self._brokerage = self.BROKERAGE_PER_ORDER
+        self._cost_coef = self.TAX_ESTIMATE_PCT
         
         # Nifty constants (Weekly Options)
         self.LOT_SIZE = 65 
         self.STRIKE_INTERVAL = 50
+        self._strike_recip = 1.0 / self.STRIKE_INTERVAL
+        self._default_expiry_cache = (None, None)  # ((ist_date, after_close), expiry code)
         
         # === NEW: Slippage & Execution Config ===
         self.slippage_pct = 0.001  # 0.1% slippage for market orders
+        # Private RNG (no shared-module lock) and precomputed 0.5x-1.5x slippage band
+        self._rng = random.Random()
+        self._slip_low = self.slippage_pct * 0.5
+        self._slip_span = self.slippage_pct * 1.0
         self.retry_config = {
             'max_retries': 3,
             'base_delay': 1.0,  # seconds
-            'backoff_multiplier': 2.0
+            'backoff_multiplier': 2.0,
+            'max_delay': 30.0,  # seconds, caps the exponential growth
+            'jitter': 0.5  # +/-50% so retries from many callers don't line up
         }
         
         # Stats
@@ -51,13 +98,30 @@ class FyersPaperBroker:
             'api_retries': 0,  # NEW: Track retry count
             'slippage_total': 0  # NEW: Track total slippage
         }
+        self._realized_paise = 0  # stats['total_pnl'] in integer paise, free of float drift
         
         # Expiry (default to None, set by main script)
         self.expiry_date = None
         
+        # Short-lived quote caches: one tick's burst of calls hits the API once per key
+        self._premium_ttl = 0.5  # seconds
+        self._premium_cache = {}  # (strike, option_type, expiry) -> (premium, monotonic ts)
+        self._spot_cache = {}  # symbol -> (price, monotonic ts)
+        self._token_health_cache = (None, 0.0)  # (result, monotonic ts)
+        self._token_health_ttl = 30.0
+        
         # Note: Fyers connection is now lazy (happens in background thread)
         self.logger.info(f" Fyers Paper Trading initialized: {initial_capital:,.2f} (Connection pending)")
 
+    # Capital is booked in integer paise so thousands of fills don't accumulate float drift
+    @property
+    def current_capital(self):
+        return self._capital_paise / 100
+
+    @current_capital.setter
+    def current_capital(self, value):
+        self._capital_paise = _to_paise(value)
+
     # === NEW: Slippage Modeling ===
     def _apply_slippage(self, price: float, side: str) -> float:
         """Apply realistic slippage to market orders."""
@@ -65,61 +129,187 @@ class FyersPaperBroker:
             return price
         
         # Random slippage between 0.05% and 0.15%
-        actual_slippage = self.slippage_pct * (0.5 + random.random())
+        actual_slippage = self._slip_low + self._slip_span * self._rng.random()
         
-        if side.lower() == 'buy':
-            slipped_price = price * (1 + actual_slippage)  # Buy higher
-        else:
-            slipped_price = price * (1 - actual_slippage)  # Sell lower
+        # Buy higher (+1), sell lower (-1)
+        sign = self._SLIPPAGE_SIGN.get(side) or self._SLIPPAGE_SIGN.get(side.lower(), -1.0)
+        slipped_price = price * (1.0 + sign * actual_slippage)
         
         slippage_amount = abs(slipped_price - price)
         self.stats['slippage_total'] += slippage_amount
         
-        self.logger.debug(f" Slippage: {price:.2f}  {slipped_price:.2f} ({actual_slippage*100:.3f}%)")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(" Slippage: %.2f  %.2f (%.3f%%)", price, slipped_price, actual_slippage * 100)
         
         return round(slipped_price, 2)
     
     # === NEW: Retry Logic ===
-    def _execute_with_retry(self, fn, *args, **kwargs):
-        """Execute function with exponential backoff retry."""
+    def _retry_delay(self, attempt):
+        """Capped exponential backoff with jitter for the given attempt"""
+        cfg = self.retry_config
+        delay = min(cfg['max_delay'], cfg['base_delay'] * (cfg['backoff_multiplier'] ** attempt))
+        return delay * (1 + random.uniform(-cfg['jitter'], cfg['jitter']))
+
+    def _auth_error(self, e=None):
+        """Auth code that makes retrying pointless: from the exception, else the broker's last response"""
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+        if status in AUTH_ERROR_CODES:
+            return status
+        return self.fyers.last_auth_error
+
+    def _retry_step(self, attempt, error):
+        """
+        Book a failed attempt. Returns the backoff delay, or None to stop
+        (token rejected, or out of attempts).
+        """
+        code = self._auth_error(error)
+        if code is not None:
+            self.logger.error(f" API call rejected with auth error {code}; not retrying")
+            return None
+        self.stats['api_retries'] += 1
         max_retries = self.retry_config['max_retries']
-        base_delay = self.retry_config['base_delay']
-        multiplier = self.retry_config['backoff_multiplier']
-        
-        for attempt in range(max_retries):
+        if attempt == max_retries - 1:
+            self.logger.error(f" API call failed after {max_retries} retries")
+            return None
+        delay = self._retry_delay(attempt)
+        reason = error if error is not None else "no data"
+        self.logger.warning(f" API call failed (attempt {attempt+1}/{max_retries}): {reason}. Retrying in {delay:.1f}s...")
+        return delay
+
+    def _execute_with_retry(self, fn, *args, **kwargs):
+        """
+        Execute function with exponential backoff retry. FyersBroker calls return
+        None instead of raising, so a None result backs off like an exception.
+        """
+        for attempt in range(self.retry_config['max_retries']):
+            error = None
             try:
                 result = fn(*args, **kwargs)
                 if result is not None:
                     return result
             except Exception as e:
-                self.stats['api_retries'] += 1
-                delay = base_delay * (multiplier ** attempt)
-                self.logger.warning(f" API call failed (attempt {attempt+1}/{max_retries}): {e}. Retrying in {delay:.1f}s...")
-                time.sleep(delay)
-        
-        self.logger.error(f" API call failed after {max_retries} retries")
+                error = e
+            delay = self._retry_step(attempt, error)
+            if delay is None:
+                break
+            time.sleep(delay)
+        return None
+
+    async def _execute_with_retry_async(self, fn, *args, **kwargs):
+        """_execute_with_retry for coroutine functions; backs off with asyncio.sleep."""
+        for attempt in range(self.retry_config['max_retries']):
+            error = None
+            try:
+                result = await fn(*args, **kwargs)
+                if result is not None:
+                    return result
+            except Exception as e:
+                error = e
+            delay = self._retry_step(attempt, error)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
         return None
 
     def get_current_price(self, symbol, last_known_price=None):
         """Get current price with retry logic. Returns None on failure (not 0)."""
+        cached = self._spot_cache.get(symbol)
+        if cached and time.monotonic() - cached[1] < self._premium_ttl:
+            return cached[0]
+        
         result = self._execute_with_retry(self.fyers.get_current_price, symbol, last_known_price)
         # CRITICAL: Return None on failure, not 0. 
         # 0 would bypass the "if not curr_premium" checks in adapters.
-        return result if result and result > 0 else None
+        if result and result > 0:
+            self._spot_cache[symbol] = (result, time.monotonic())
+            return result
+        return None
+
+    def _cached_option_chain(self, strike, option_type, expiry_date=None):
+        """Option premium via FyersBroker, memoized for _premium_ttl seconds per contract"""
+        expiry_date = expiry_date or self.expiry_date
+        key = (strike, option_type, expiry_date)
+        cached = self._premium_cache.get(key)
+        if cached and time.monotonic() - cached[1] < self._premium_ttl:
+            return cached[0]
+        
+        premium = self.fyers.get_option_chain(strike, option_type, expiry_date)
+        if premium:
+            self._premium_cache[key] = (premium, time.monotonic())
+        return premium
         
     def get_latest_bars(self, symbol, timeframe='1', limit=100):
         """Get latest bars with retry logic."""
-        import pandas as pd
         result = self._execute_with_retry(self.fyers.get_latest_bars, symbol, timeframe, limit)
         return result if result is not None else pd.DataFrame()
 
     def get_atm_strike(self, spot_price):
-        return round(spot_price / self.STRIKE_INTERVAL) * self.STRIKE_INTERVAL
+        return int(spot_price * self._strike_recip + 0.5) * self.STRIKE_INTERVAL
 
     def _get_default_expiry(self):
-        """Get near-term Tuesday expiry in Fyers format"""
-        from src.utils.date_utils import get_next_tuesday_expiry
-        return get_next_tuesday_expiry()
+        """Get near-term expiry in Fyers format, recomputed only when the IST day or session half changes"""
+        now = datetime.now(IST)
+        # Expiry rolls over at the 15:30 close, so the cache key includes which side of it we're on
+        key = (now.date(), (now.hour, now.minute) >= (15, 30))
+        if self._default_expiry_cache[0] != key:
+            self._default_expiry_cache = (key, get_next_nifty_expiry())
+        return self._default_expiry_cache[1]
+
+    async def get_current_price_async(self, symbol, last_known_price=None):
+        """Async get_current_price sharing the same spot cache"""
+        cached = self._spot_cache.get(symbol)
+        if cached and time.monotonic() - cached[1] < self._premium_ttl:
+            return cached[0]
+        
+        result = await self._execute_with_retry_async(self.fyers.get_current_price_async, symbol, last_known_price)
+        if result and result > 0:
+            self._spot_cache[symbol] = (result, time.monotonic())
+            return result
+        return None
+
+    async def _cached_option_chain_async(self, strike, option_type, expiry_date=None):
+        """Async _cached_option_chain sharing the same premium cache"""
+        expiry_date = expiry_date or self.expiry_date
+        key = (strike, option_type, expiry_date)
+        cached = self._premium_cache.get(key)
+        if cached and time.monotonic() - cached[1] < self._premium_ttl:
+            return cached[0]
+        
+        premium = await self.fyers.get_option_chain_async(strike, option_type, expiry_date)
+        if premium:
+            self._premium_cache[key] = (premium, time.monotonic())
+        return premium
+
+    def _cached_option_chain_batch(self, contracts):
+        """
+        Premiums for many (strike, option_type, expiry) keys: fresh cache hits are
+        reused, the rest are fetched in one batched quotes call per expiry.
+        """
+        now = time.monotonic()
+        premiums = {}
+        missing = {}
+        for key in set(contracts):
+            cached = self._premium_cache.get(key)
+            if cached and now - cached[1] < self._premium_ttl:
+                premiums[key] = cached[0]
+            else:
+                missing.setdefault(key[2], []).append(key[:2])
+        
+        for exp, pairs in missing.items():
+            # FyersBroker absorbs transport errors and returns None for legs it
+            # couldn't quote, so a partial refresh shows up as missing premiums
+            batch = self.fyers.get_option_chain_batch(pairs, exp)
+            now = time.monotonic()
+            unavailable = 0
+            for (strike, otype), premium in batch.items():
+                premiums[(strike, otype, exp)] = premium
+                if premium:
+                    self._premium_cache[(strike, otype, exp)] = (premium, now)
+                else:
+                    unavailable += 1
+            if unavailable:
+                self.logger.warning(f"PnL refresh partial, {unavailable}/{len(pairs)} premiums unavailable for expiry {exp}")
+        return premiums
 
     def submit_order(self, symbol, qty, side, order_type='MARKET', price=None, instrument=None):
         """
@@ -148,21 +338,77 @@ class FyersPaperBroker:
         
         # 2. Determine Option
         atm_strike = self.get_atm_strike(spot_price)
+        option_type = self._order_option_type(side, instrument)
+        exp = self.expiry_date if self.expiry_date else self._get_default_expiry()
         
-        # Determine Instrument (CE/PE)
-        if instrument:
-            option_type = instrument
-        else:
-            option_type = 'CE' if side == 'buy' else 'PE'
+        # 3. Get REAL Premium (with retry)
+        premium = self._execute_with_retry(self._cached_option_chain, atm_strike, option_type, exp)
         
-        # Set expiry
+        return self._fill_order(qty, side, order_type, price, spot_price, atm_strike, option_type, exp, premium)
+
+    async def submit_order_async(self, symbol, qty, side, order_type='MARKET', price=None, instrument=None):
+        """
+        Async submit_order: the spot and premium fetches overlap, using the cached
+        spot to guess the ATM strike and re-pricing only if the guess was wrong.
+        """
+        if not self.fyers.connected:
+            self.logger.error("Cannot submit order - Fyers not connected")
+            return None
+
+        option_type = self._order_option_type(side, instrument)
         exp = self.expiry_date if self.expiry_date else self._get_default_expiry()
-        option_symbol = f"NSE:NIFTY{exp}{atm_strike}{option_type}"
         
-        # 3. Get REAL Premium (with retry)
-        premium = self._execute_with_retry(
-            self.fyers.get_option_chain, strike=atm_strike, option_type=option_type, expiry_date=exp
-        )
+        cached_spot = self._spot_cache.get("NIFTY")
+        if cached_spot:
+            guess_strike = self.get_atm_strike(cached_spot[0])
+            spot_price, premium = await asyncio.gather(
+                self.get_current_price_async("NIFTY"),
+                self._execute_with_retry_async(self._cached_option_chain_async, guess_strike, option_type, exp),
+            )
+        else:
+            guess_strike, premium = None, None
+            spot_price = await self.get_current_price_async("NIFTY")
+        if not spot_price:
+            self.logger.error("Cannot get spot price")
+            return None
+        
+        atm_strike = self.get_atm_strike(spot_price)
+        if atm_strike != guess_strike:
+            premium = await self._execute_with_retry_async(self._cached_option_chain_async, atm_strike, option_type, exp)
+        
+        return self._fill_order(qty, side, order_type, price, spot_price, atm_strike, option_type, exp, premium)
+
+    def _option_symbol(self, key):
+        """Display symbol for an (expiry, strike, type) position key, formatted once"""
+        sym = self._symbol_cache.get(key)
+        if sym is None:
+            exp, strike, otype = key
+            sym = sys.intern(f"NSE:NIFTY{exp}{strike}{otype}")
+            self._symbol_cache[key] = sym
+            self._symbol_keys[sym] = key
+        return sym
+
+    def _position_key(self, position):
+        """Accept a position key tuple or a legacy NSE:NIFTY... symbol string"""
+        if isinstance(position, tuple):
+            return position
+        return self._symbol_keys.get(sys.intern(position), position)
+
+    def _order_option_type(self, side, instrument):
+        """CE/PE for an order: explicit instrument, else CE for buys and PE for sells"""
+        if instrument:
+            return instrument
+        return 'CE' if side == 'buy' else 'PE'
+
+    def _fill_order(self, qty, side, order_type, price, spot_price, atm_strike, option_type, exp, premium):
+        """Book a paper fill once spot and premium are known (shared by sync and async submit)"""
+        # Hot path: bind attributes once (LOAD_FAST instead of LOAD_ATTR)
+        logger = self.logger
+        positions = self.positions
+        br, cc = self._brokerage, self._cost_coef
+        
+        key = (exp, atm_strike, option_type)
+        option_symbol = self._option_symbol(key)
         
         if not premium:
             premium = self._estimate_premium(spot_price, atm_strike, option_type)
@@ -173,104 +419,110 @@ class FyersPaperBroker:
         # 4. LIMIT ORDER HANDLING
         if order_type.upper() == 'LIMIT':
             if price is None:
-                self.logger.error("LIMIT order requires price parameter")
+                logger.error("LIMIT order requires price parameter")
                 return None
             
             # For limit orders, check if market price is favorable
             if side == 'buy' and premium > price:
-                self.logger.info(f" LIMIT BUY pending: Market {premium:.2f} > Limit {price:.2f}")
+                logger.info(f" LIMIT BUY pending: Market {premium:.2f} > Limit {price:.2f}")
                 return {'status': 'pending', 'order_type': 'LIMIT', 'limit_price': price}
             elif side == 'sell' and premium < price:
-                self.logger.info(f" LIMIT SELL pending: Market {premium:.2f} < Limit {price:.2f}")
+                logger.info(f" LIMIT SELL pending: Market {premium:.2f} < Limit {price:.2f}")
                 return {'status': 'pending', 'order_type': 'LIMIT', 'limit_price': price}
             
             # Limit order can be filled at limit price
             execution_price = price
-            self.logger.info(f" LIMIT order filled at {price:.2f}")
+            logger.info(f" LIMIT order filled at {price:.2f}")
         else:
             # MARKET ORDER: Apply slippage
             execution_price = self._apply_slippage(premium, side)
-            self.logger.debug(f"Market order: Premium {premium:.2f}  Execution {execution_price:.2f}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Market order: Premium %.2f  Execution %.2f", premium, execution_price)
 
         # 5. Execute Logic
         total_shares = qty  # Expected to be absolute shares (lots * lot_size)
         order_value = total_shares * execution_price
         
-        timestamp = datetime.now()
+        timestamp_ns = time.time_ns()
         order_id = f"PAPER_{self.order_id_counter}"
         self.order_id_counter += 1
         
+        capital_paise = self._capital_paise
         if side == 'buy':
             # Deduct Brokerage and Taxes on Entry
-            entry_costs = self.BROKERAGE_PER_ORDER + (order_value * self.TAX_ESTIMATE_PCT)
-            self.current_capital -= (order_value + entry_costs)
+            entry_costs = br + order_value * cc
+            capital_paise -= _to_paise(order_value + entry_costs)
             
-            self.positions[option_symbol] = {
-                'order_id': order_id,
-                'entry_price': premium,
-                'qty': qty,
-                'shares': total_shares,
-                'spot_entry': spot_price,
-                'entry_time': timestamp,
-                'strike': atm_strike,
-                'type': option_type,
-                'entry_costs': entry_costs
-            }
-            self.logger.info(f" [BUY] {qty} lots {option_symbol} @ {premium:.2f} | Costs: {entry_costs:.2f}")
+            positions[key] = PaperPosition(
+                order_id=order_id,
+                entry_price=premium,
+                qty=qty,
+                shares=total_shares,
+                spot_entry=spot_price,
+                entry_time_ns=timestamp_ns,
+                strike=atm_strike,
+                type=option_type,
+                expiry=exp,
+                entry_costs=entry_costs,
+            )
+            logger.info(f" [BUY] {qty} lots {option_symbol} @ {premium:.2f} | Costs: {entry_costs:.2f}")
 
         elif side == 'sell':
             # Closing position
-            if option_symbol in self.positions:
-                pos = self.positions[option_symbol]
+            if key in positions:
+                pos = positions[key]
                 
-                # Check current premium or use execution price if provided
-                exit_premium = premium if premium else self.fyers.get_option_chain(strike=pos['strike'], option_type=pos['type'])
-                if not exit_premium: exit_premium = self._estimate_premium(spot_price, pos['strike'], pos['type'])
+                # premium was already fetched with retry (or estimated) for this same contract
+                exit_premium = premium
                 
                 # Calculate Exit Costs
-                exit_value = exit_premium * pos['shares']
-                exit_costs = self.BROKERAGE_PER_ORDER + (exit_value * self.TAX_ESTIMATE_PCT)
+                exit_value = exit_premium * pos.shares
+                exit_costs = br + exit_value * cc
                 
-                pnl = exit_value - (pos['entry_price'] * pos['shares']) - pos['entry_costs'] - exit_costs
-                self.current_capital += (exit_value - exit_costs)
+                pnl = exit_value - (pos.entry_price * pos.shares) - pos.entry_costs - exit_costs
+                capital_paise += _to_paise(exit_value - exit_costs)
                 
-                self.logger.info(f" [SELL] {option_symbol} @ {exit_premium:.2f} | Net PnL: {pnl:+.2f} (Total Costs: {pos['entry_costs'] + exit_costs:.2f})")
+                logger.info(f" [SELL] {option_symbol} @ {exit_premium:.2f} | Net PnL: {pnl:+.2f} (Total Costs: {pos.entry_costs + exit_costs:.2f})")
                 
                 # Update stats...
-                del self.positions[option_symbol]
+                self.closed_trades.append((option_symbol, pos.qty, pos.entry_price, exit_premium, pnl, timestamp_ns))
+                del positions[key]
                 
+        self._capital_paise = capital_paise
         return {'status': 'filled', 'order_id': order_id, 'price': premium}
 
-    def _estimate_premium(self, spot, strike, otype):
+    def _estimate_premium_batch(self, spot, strikes, otypes=None):
         """
-        Fallback premium estimation using simplified Black-Scholes
-        Used when Fyers API doesn't return option prices (market closed)
+        Fallback premium estimation for many strikes in one vectorized pass.
+        Used when Fyers API doesn't return option prices (market closed).
+        The heuristic is symmetric in CE/PE; otypes is accepted for call-site symmetry.
         """
-        import math
+        strikes = np.asarray(strikes, dtype=np.float64)
         
         # Approximate ATM option premium as % of spot
         # ATM options typically trade at 0.8-1.5% of spot for weekly expiry
+        moneyness = np.abs(spot - strikes) / spot
         
-        moneyness = abs(spot - strike) / spot
-        
-        if moneyness < 0.01:  # ATM
-            base_premium = spot * 0.008  # 0.8% of spot
-        elif moneyness < 0.02:  # Near ATM
-            base_premium = spot * 0.005
-        else:  # OTM
-            base_premium = spot * 0.003
+        # ATM: 0.8% of spot, near ATM: 0.5%, OTM: 0.3%
+        base_premium = np.where(moneyness < 0.01, spot * 0.008,
+                                np.where(moneyness < 0.02, spot * 0.005, spot * 0.003))
         
         # Add some volatility premium
-        vol_premium = spot * 0.002 * (0.5 + 0.5 * math.exp(-moneyness * 50))
-        
-        premium = base_premium + vol_premium
+        vol_premium = spot * 0.002 * (0.5 + 0.5 * np.exp(-moneyness * 50))
         
         # Minimum premium floor
-        premium = max(premium, 10.0)
+        return np.round(np.maximum(base_premium + vol_premium, 10.0), 2)
+
+    def _estimate_premium(self, spot, strike, otype):
+        """
+        Fallback premium estimation using simplified Black-Scholes
+        Used when Fyers API doesn't return option prices (market closed)
+        """
+        premium = float(self._estimate_premium_batch(spot, [strike], [otype])[0])
         
         self.logger.info(f" Using estimated premium for {strike}{otype}: {premium:.2f} (market may be closed)")
         
-        return round(premium, 2)
+        return premium
 
     def get_account_balance(self):
         return self.current_capital
@@ -281,16 +533,38 @@ class FyersPaperBroker:
         realized = self.stats['total_pnl']
         
         # Unrealized PnL from open positions
-        unrealized = 0
-        for sym, pos in self.positions.items():
-            try:
-                current_premium = self.fyers.get_option_chain(strike=pos['strike'], option_type=pos['type'])
-                if current_premium:
-                    unrealized += (current_premium - pos['entry_price']) * pos['shares']
-            except Exception as e:
-                self.logger.warning(f"Could not get current premium for {sym}: {e}")
+        open_positions = list(self.positions.values())
+        default_exp = self.expiry_date
+        keys = [(pos.strike, pos.type, pos.expiry or default_exp) for pos in open_positions]
+        premiums = self._cached_option_chain_batch(keys)
+        
+        return realized + self._unrealized_pnl(open_positions, keys, premiums)
+
+    async def get_total_pnl_async(self):
+        """get_total_pnl with the per-position premium lookups running concurrently"""
+        realized = self.stats['total_pnl']
+        
+        open_positions = list(self.positions.values())
+        default_exp = self.expiry_date
+        keys = [(pos.strike, pos.type, pos.expiry or default_exp) for pos in open_positions]
+        unique_keys = list(set(keys))
+        results = await asyncio.gather(
+            *[self._cached_option_chain_async(*key) for key in unique_keys],
+            return_exceptions=True
+        )
+        premiums = {k: r for k, r in zip(unique_keys, results) if not isinstance(r, Exception)}
         
-        return realized + unrealized
+        return realized + self._unrealized_pnl(open_positions, keys, premiums)
+
+    @staticmethod
+    def _unrealized_pnl(open_positions, keys, premiums):
+        """Sum of (current - entry) * shares over legs that have a live premium"""
+        unrealized = 0
+        for key, pos in zip(keys, open_positions):
+            current_premium = premiums.get(key)
+            if current_premium:
+                unrealized += (current_premium - pos.entry_price) * pos.shares
+        return unrealized
 
     def close_all_positions(self):
         for symbol in list(self.positions.keys()):
@@ -298,56 +572,94 @@ class FyersPaperBroker:
 
     def close_position(self, option_symbol, qty=None):
         """
-        Close a specific position by symbol directly.
+        Close a specific position by (expiry, strike, type) key or symbol string.
         Supports partial exit if qty < position qty.
         """
-        if option_symbol not in self.positions:
+        key = self._position_key(option_symbol)
+        if key not in self.positions:
             self.logger.warning(f" Cannot close {option_symbol} - not found in positions")
             return False
             
-        pos = self.positions[option_symbol]
-        current_qty = pos['qty']
-        
-        # Determine exit quantity
-        exit_qty = qty if qty and qty < current_qty else current_qty
+        pos = self.positions[key]
         
         # Get current price for exit
         spot_price = self.get_current_price("NIFTY")
-        exit_premium = self.fyers.get_option_chain(strike=pos['strike'], option_type=pos['type'])
+        exit_premium = self._cached_option_chain(pos.strike, pos.type, pos.expiry)
+        return self._book_close(key, qty, spot_price, exit_premium)
+
+    async def close_position_async(self, option_symbol, qty=None):
+        """Async close_position: spot and exit premium are fetched concurrently"""
+        key = self._position_key(option_symbol)
+        if key not in self.positions:
+            self.logger.warning(f" Cannot close {option_symbol} - not found in positions")
+            return False
+        
+        pos = self.positions[key]
+        spot_price, exit_premium = await asyncio.gather(
+            self.get_current_price_async("NIFTY"),
+            self._cached_option_chain_async(pos.strike, pos.type, pos.expiry),
+        )
+        return self._book_close(key, qty, spot_price, exit_premium)
+
+    def _book_close(self, key, qty, spot_price, exit_premium):
+        """Apply a (partial) exit to the books once prices are known"""
+        positions = self.positions
+        stats = self.stats
+        lot_size = self.LOT_SIZE
+        logger = self.logger
+        
+        pos = positions[key]
+        option_symbol = self._option_symbol(key)
+        current_qty = pos.qty
+        
+        # Determine exit quantity
+        exit_qty = qty if qty and qty < current_qty else current_qty
         
         if not exit_premium: 
-            exit_premium = self._estimate_premium(spot_price, pos['strike'], pos['type'])
+            exit_premium = self._estimate_premium(spot_price, pos.strike, pos.type)
             
         # Calculate PnL
-        shares_to_close = exit_qty * self.LOT_SIZE
-        pnl = (exit_premium - pos['entry_price']) * shares_to_close
+        shares_to_close = exit_qty * lot_size
+        pnl = (exit_premium - pos.entry_price) * shares_to_close
         
         # Update Capital
-        self.current_capital += (exit_premium * shares_to_close)
+        self._capital_paise += _to_paise(exit_premium * shares_to_close)
+        
+        logger.info(f" [SELL/CLOSE] {option_symbol} | Qty: {exit_qty} | @ {exit_premium:.2f} | PnL: {pnl:+.2f}")
         
-        self.logger.info(f" [SELL/CLOSE] {option_symbol} | Qty: {exit_qty} | @ {exit_premium:.2f} | PnL: {pnl:+.2f}")
+        self.closed_trades.append((option_symbol, exit_qty, pos.entry_price, exit_premium, pnl, time.time_ns()))
         
         # Update stats
-        self.stats['total_pnl'] += pnl
-        if pnl > 0: self.stats['winning_trades'] += 1
-        else: self.stats['losing_trades'] += 1
+        self._realized_paise += _to_paise(pnl)
+        stats['total_pnl'] = self._realized_paise / 100
+        if pnl > 0: stats['winning_trades'] += 1
+        else: stats['losing_trades'] += 1
         
         if qty is None or exit_qty == current_qty:
              # Full Close
-             self.stats['total_trades'] += 1 
-             del self.positions[option_symbol]
+             stats['total_trades'] += 1 
+             del positions[key]
         else:
              # Partial Close
-             self.positions[option_symbol]['qty'] -= exit_qty
-             self.positions[option_symbol]['shares'] = self.positions[option_symbol]['qty'] * self.LOT_SIZE
-             self.logger.info(f" Partial Exit complete. Remaining: {self.positions[option_symbol]['qty']} lots")
+             pos.qty -= exit_qty
+             pos.shares = pos.qty * lot_size
+             logger.info(f" Partial Exit complete. Remaining: {pos.qty} lots")
         
         return True
         
     def check_token_health(self):
-        """Proxy health check to underlying FyersBroker"""
+        """Proxy health check to underlying FyersBroker (healthy results cached for 30s)"""
+        now = time.monotonic()
+        cached, ts = self._token_health_cache
+        if cached is not None and now - ts < self._token_health_ttl:
+            return cached
+        
         if hasattr(self, 'fyers') and self.fyers:
-            return self.fyers.check_token_health()
+            result = self.fyers.check_token_health()
+            # Only a healthy answer is cached, so a failing token is re-checked every call
+            if result.get('status') == 'active':
+                self._token_health_cache = (result, now)
+            return result
         return {"status": "error", "message": "FyersBroker not initialized"}
 
     def print_daily_summary(self):
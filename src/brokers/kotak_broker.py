@@ -1,23 +1,150 @@
+"""
+Kotak Neo Broker Implementation
+Live orders plus WebSocket LTP feed aggregated into bars.
 
+Threading contract: the WS thread (on_message -> _process_ticks) is the only writer of
+ltp_cache, which is a _WriteOrderedCache: reads never reorder it and eviction follows
+write order. Readers take a single ltp_cache.get(token) - one GIL-atomic probe that
+leaves the dict untouched, no lock - and never check-then-index, so a concurrent tick
+can't slip in between.
+"""
 import os
 import sys
+import json
 import time
+import queue
+import atexit
+import socket
 import logging
-import traceback
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import pyotp
 import requests
+from requests.adapters import HTTPAdapter
 from neo_api_client import NeoAPI
 from src.utils.bar_aggregator import BarAggregator
+from src.brokers.fyers_auto_login import atomic_write
+
+# Bound once at import for the per-tick WS path.
+# fastnumbers (optional) is a drop-in, faster float() for the numeric strings in each tick.
+try:
+    from fastnumbers import float as _float
+except ImportError:
+    _float = float
+# orjson (optional) decodes raw WS payloads several times faster than json
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+_time = time.time
+
+NIFTY_TOKEN = 26000
+# Spellings of the Nifty 50 index after upper-casing and dropping spaces/hyphens
+_INDEX_SYMBOLS = frozenset({"NIFTY", "NIFTY50", "NIFTYINDEX", "NIFTY50INDEX"})
+_INDEX_KEY_STRIP = str.maketrans("", "", " -")  # built once; one translate pass drops both
+
+# Common spellings mapped straight to Neo codes; anything else falls back to .upper() matching
+_TXN_TYPES = {"BUY": "B", "SELL": "S", "buy": "B", "sell": "S"}
+_ORDER_TYPES = {"MARKET": "MKT", "LIMIT": "L", "market": "MKT", "limit": "L"}
+_OPTION_TYPES = {t: sys.intern(t.upper()) for t in ("CE", "PE", "ce", "pe")}
+
+TOKEN_MAP_FILE = '.kotak_token_map.json'
+TOKEN_MAP_TTL_SECS = 24 * 3600
+TOKEN_MAP_CAPACITY = 4096
+LTP_CACHE_CAPACITY = 8192
+REST_QUOTE_TTL_SECS = 0.5
+
+TICK_QUEUE_MAXSIZE = 10_000  # frames buffered for the aggregator before the WS thread starts dropping
+TICK_DRAIN_MAX = 256         # frames the consumer pulls per wake-up
+
+# Attribute names the SDK has used on the path NeoAPI -> WS client -> websocket-client app -> raw socket
+_WS_SOCKET_PATH_ATTRS = ('NeoWebSocket', 'neo_ws', 'hsWebsocket', 'hsw', 'ws', 'websocket', 'sock')
+
+def _to_int_token(token):
+    """Canonical int key for an instrument token ("26000" -> 26000); non-numeric tokens pass through"""
+    try:
+        return int(token)
+    except (TypeError, ValueError):
+        return token
+
+class _LRUCache(OrderedDict):
+    """OrderedDict bounded to `capacity` entries; reads and writes refresh recency, the oldest is evicted"""
+
+    def __init__(self, capacity, *args):
+        self.capacity = capacity
+        super().__init__(*args)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.capacity:
+            self.popitem(last=False)
+
+    def put_many(self, items):
+        """Bulk insert for a WS frame: evicts once at the end instead of per item"""
+        setitem, move = OrderedDict.__setitem__, self.move_to_end
+        for key, value in items:
+            setitem(self, key, value)
+            move(key)
+        while len(self) > self.capacity:
+            self.popitem(last=False)
+
+class _WriteOrderedCache(_LRUCache):
+    """
+    _LRUCache whose reads don't touch recency: the oldest *write* is evicted.
+    Readers on other threads can't reorder the dict under its single writer.
+    """
+    __getitem__ = OrderedDict.__getitem__
+    get = OrderedDict.get
+
+# Every live broker's token map is saved by one atexit hook (no per-instance registration)
+_LIVE_BROKERS = weakref.WeakSet()
+
+@atexit.register
+def _save_token_maps_at_exit():
+    for broker in list(_LIVE_BROKERS):
+        broker._save_token_map()
 
 class KotakBroker:
+    # Fixed attribute set: no per-instance __dict__ on the WS hot path (subclasses may still add their own)
+    __slots__ = (
+        'logger', 'db_handler', 'api', 'connected', '_http', 'token_map', '_token_to_symbol', '_token_map_dirty',
+        'CONSUMER_KEY', 'CONSUMER_SECRET', 'MOBILE_NUMBER', 'PASSWORD', 'MPIN', 'TOTP_SECRET', 'UCC', '_totp', '_totp_cache',
+        'ltp_cache', 'subscribed_tokens', '_subscribed_snapshot', '_tick_log_counter', '_tick_log_every',
+        '_first_tick_events', '_quote_payloads', '_nifty_ltp',
+        '_rest_quotes', '_inflight', '_inflight_lock',
+        'aggregator', '_tick_q', '_tick_consumer_thread', '_dropped_frames', '_ws_tuned',
+        '__weakref__',
+    )
+
     def __init__(self, logger=None, db_handler=None):
         self.logger = logger or logging.getLogger(__name__)
         self.db_handler = db_handler
         self.api = None
         self.connected = False
-        self.token_map = {} # Cache for symbol -> token
+        self._http = self._build_session()  # pooled session for direct REST calls outside the SDK
+        self.token_map = _LRUCache(TOKEN_MAP_CAPACITY, self._load_token_map()) # Cache for symbol -> token (persisted across restarts)
+        # Reverse index token -> symbol, kept in step with every token_map insert
+        self._token_to_symbol = _LRUCache(TOKEN_MAP_CAPACITY, ((m['token'], sym) for sym, m in self.token_map.items()))
+        self._token_map_dirty = False
+        _LIVE_BROKERS.add(self)
         
         # Load Credentials
         self.CONSUMER_KEY = os.getenv("KOTAK_CONSUMER_KEY")
@@ -27,57 +154,201 @@ class KotakBroker:
         self.MPIN = os.getenv("KOTAK_MPIN")
         self.TOTP_SECRET = os.getenv("KOTAK_TOTP_SECRET")
         self.UCC = os.getenv("KOTAK_UCC")
+        self._totp = pyotp.TOTP(self.TOTP_SECRET) if self.TOTP_SECRET else None
+        self._totp_cache = None  # (window, code): codes are fixed within a TOTP interval
         
         # WebSocket State
-        self.ltp_cache = {} # Map "26000" -> 25980.0
+        self.ltp_cache = _WriteOrderedCache(LTP_CACHE_CAPACITY) # Map 26000 -> 25980.0 (int token keys)
         self.subscribed_tokens = set()
+        # Read-only copy swapped in after each subscribe; hot-path membership checks use this
+        self._subscribed_snapshot = frozenset()
+        self._nifty_ltp = None  # Nifty 50 spot, mirrored from ltp_cache once per WS frame
+        self._tick_log_counter = 0
+        self._tick_log_every = 1000
+        # token -> Event set by the WS thread on that token's first tick (then dropped)
+        self._first_tick_events = {}
+        # token -> prebuilt REST quotes payload, reused on every get_current_price call
+        self._quote_payloads = {}
+        # token -> (ltp, monotonic) from REST, and token -> Event for the one REST call in flight
+        self._rest_quotes = _LRUCache(LTP_CACHE_CAPACITY)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
         
-        # Aggregator
+        # Aggregator (fed off the WS thread via _tick_q)
         self.aggregator = BarAggregator(intervals=[1, 5, 15])
+        self._tick_q = queue.Queue(maxsize=TICK_QUEUE_MAXSIZE)
+        self._tick_consumer_thread = None
+        self._dropped_frames = 0
+        self._ws_tuned = False
         
-    def _generate_totp(self):
-        if not self.TOTP_SECRET: return None
+    def _build_session(self):
+        """Pooled keep-alive HTTP session for our own REST fallbacks"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50)
+        session.mount("https://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def _load_token_map(self):
+        """Loads the search_scrip cache from disk, dropping entries older than TOKEN_MAP_TTL_SECS"""
         try:
-            return pyotp.TOTP(self.TOTP_SECRET).now()
+            with open(TOKEN_MAP_FILE, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        cutoff = time.time() - TOKEN_MAP_TTL_SECS
+        return {sym: m for sym, m in data.items() if m.get('ts', 0) >= cutoff}
+
+    def _save_token_map(self):
+        """
+        Writes the token cache back to disk if search_scrip added entries, merged
+        with what other brokers/processes already saved (newest 'ts' per symbol wins)
+        """
+        if not self._token_map_dirty:
+            return
+        try:
+            merged = self._load_token_map()
+            for sym, meta in self.token_map.items():
+                saved = merged.get(sym)
+                if saved is None or meta.get('ts', 0) >= saved.get('ts', 0):
+                    merged[sym] = meta
+            if len(merged) > TOKEN_MAP_CAPACITY:
+                newest = sorted(merged.items(), key=lambda kv: kv[1].get('ts', 0))[-TOKEN_MAP_CAPACITY:]
+                merged = dict(newest)
+            atomic_write(TOKEN_MAP_FILE, json.dumps(merged))
+            self._token_map_dirty = False
         except Exception as e:
+            self.logger.error(f" Token map save failed: {e}")
+
+    def _generate_totp(self):
+        if not self._totp: return None
+        now = int(time.time())
+        window = now // self._totp.interval
+        cached = self._totp_cache
+        if cached and cached[0] == window:
+            return cached[1]
+        try:
+            code = self._totp.at(now)
+            self._totp_cache = (window, code)
+            return code
+        except (ValueError, TypeError) as e:  # malformed base32 secret
             print(f" [KOTAK] TOTP generation failed: {e}")
             return None
         
-    # WS Callbacks
     # WS Callbacks
     def on_message(self, message):
         """WebSocket Message Handler"""
         # self.logger.info(f" WS Message: {str(message)[:100]}...")
         try:
+             # Some SDK versions hand over the raw JSON text instead of a decoded object
+             if isinstance(message, (str, bytes)):
+                 message = _json_loads(message)
              # Kotak might send {'data': [...]} or direct list/dict depending on subscription?
              # Based on previous log: {'type': 'stock_feed', 'data': [...]}
-             if isinstance(message, dict) and 'data' in message:
-                 for m in message['data']:
-                     self.process_tick(m)
-             elif isinstance(message, list):
-                 for m in message:
-                     self.process_tick(m)
+             data = message.get('data') if isinstance(message, dict) else message
+             if data and isinstance(data, list):
+                 self._process_ticks(data)
              # else: unknown format
         except Exception as e:
              self.logger.error(f"WS Message Error: {e}")
 
     def process_tick(self, msg):
+        self._process_ticks([msg])
+
+    def _process_ticks(self, ticks):
+        """Parse a frame of ticks in one pass, then update cache and aggregator once"""
         try:
-             token = str(msg.get('tk'))
-             ltp_str = msg.get('ltp') or msg.get('lp')
-             # Index value might be under 'iv'?
-             if not ltp_str and 'iv' in msg: ltp_str = msg.get('iv')
-                 
-             if token and ltp_str:
-                 ltp = float(ltp_str)
-                 self.ltp_cache[token] = ltp
-                 self.logger.info(f" Cache Updated: {token} -> {ltp}")
-                 
-                 vol = float(msg.get('v', 0))
-                 ts = time.time()
-                 self.aggregator.process_tick(token, ltp, vol, ts)
-        except Exception as e:
-             self.logger.error(f"Tick Processing Error: {e}")
+            tokens, ltps, vols = self._parse_ticks(ticks)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            # A malformed tick: redo the frame tick-by-tick so the good ones still land
+            self.logger.error(f"Tick Processing Error: {e}")
+            tokens, ltps, vols = [], [], []
+            for msg in ticks:
+                try:
+                    t, l, v = self._parse_ticks((msg,))
+                except (KeyError, TypeError, ValueError, AttributeError):
+                    continue
+                tokens += t
+                ltps += l
+                vols += v
+        
+        if not tokens:
+            return
+        self.ltp_cache.put_many(zip(tokens, ltps))
+        self._nifty_ltp = self.ltp_cache.get(NIFTY_TOKEN, self._nifty_ltp)
+        pending = self._first_tick_events
+        if pending:
+            for token in tokens:
+                evt = pending.pop(token, None)
+                if evt is not None:
+                    evt.set()
+        # Sample the cache log: one line per _tick_log_every ticks, formatted lazily
+        self._tick_log_counter += len(tokens)
+        if self._tick_log_counter >= self._tick_log_every:
+            self._tick_log_counter = 0
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(" Cache Updated: %s -> %s", tokens[-1], ltps[-1])
+        # Bar rollups happen on the consumer thread; the WS thread only enqueues
+        frame = (tokens, ltps, vols, _time())
+        q = self._tick_q
+        try:
+            q.put_nowait(frame)
+        except queue.Full:
+            # Back-pressure: shed the oldest frame so the newest prices still reach the bars
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass  # consumer drained it meanwhile
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                pass
+            self._dropped_frames += 1
+            if self._dropped_frames % 1000 == 1:
+                self.logger.warning(f" Tick queue full, dropped {self._dropped_frames} oldest frame(s) from aggregation")
+
+    def _tick_consumer(self):
+        """Drains queued frames in batches into the aggregator"""
+        q = self._tick_q
+        process = self.aggregator.process_ticks_batch
+        while True:
+            batch = [q.get()]
+            while len(batch) < TICK_DRAIN_MAX:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            for tokens, ltps, vols, ts in batch:
+                try:
+                    process(tokens, ltps, vols, ts)
+                except Exception as e:
+                    self.logger.error(f"Aggregator Error: {e}")
+
+    def _start_tick_consumer(self):
+        if self._tick_consumer_thread is not None and self._tick_consumer_thread.is_alive():
+            return
+        self._tick_consumer_thread = threading.Thread(target=self._tick_consumer, name="kotak-tick-consumer", daemon=True)
+        self._tick_consumer_thread.start()
+
+    @staticmethod
+    def _parse_ticks(ticks):
+        """Fast path: no per-tick try frame, locals for every lookup"""
+        tokens, ltps, vols = [], [], []
+        add_token, add_ltp, add_vol = tokens.append, ltps.append, vols.append
+        to_token, to_float = _to_int_token, _float  # LOAD_FAST instead of LOAD_GLOBAL per tick
+        for msg in ticks:
+            get = msg.get
+            tk = get('tk')
+            if tk is None:
+                continue
+            # Index value might be under 'iv'
+            ltp_str = get('ltp') or get('lp') or get('iv')
+            if ltp_str:
+                add_token(to_token(tk))
+                add_ltp(to_float(ltp_str))
+                v = get('v')
+                add_vol(to_float(v) if v else 0.0)
+        return tokens, ltps, vols
 
     def on_error(self, error):
         self.logger.error(f"WS Error: {error}")
@@ -155,7 +426,6 @@ class KotakBroker:
                     if login_resp and isinstance(login_resp, dict) and 'error' in login_resp:
                         self.logger.info(" Attempting manual request with PascalCase 'MobileNumber'...")
                         try:
-                            import requests
                             # Get domain and path
                             base_url = self.api.configuration.get_domain(session_init=True)
                             url = f"{base_url}/login/1.0/tradeApiLogin"
@@ -173,7 +443,7 @@ class KotakBroker:
                                 "totp": otp
                             }
                             
-                            res = requests.post(url, headers=headers, json=payload)
+                            res = self._http.post(url, headers=headers, json=payload, timeout=5)
                             if res.status_code == 200:
                                 login_resp = res.json()
                                 self.logger.info(f" Manual login success (Attempt 3): {login_resp}")
@@ -217,11 +487,8 @@ class KotakBroker:
                     return
 
             except Exception as e_login:
-                self.logger.error(f" Login Methodology Failure: {e_login}")
-                try:
-                    self.logger.error(traceback.format_exc())
-                except Exception:
-                    self.logger.error(f" (traceback unavailable)")
+                # exception() formats the traceback only if a handler emits the record
+                self.logger.exception(f" Login Methodology Failure: {e_login}")
                 self.connected = False
                 return
             
@@ -248,11 +515,7 @@ class KotakBroker:
                 self.connected = False
                     
         except Exception as e:
-            self.logger.error(f" Kotak Connection Critical Error: {e}")
-            try:
-                self.logger.error(traceback.format_exc())
-            except Exception:
-                self.logger.error(f" (traceback unavailable)")
+            self.logger.exception(f" Kotak Connection Critical Error: {e}")
             self.connected = False
     
     def start_websocket(self):
@@ -261,11 +524,11 @@ class KotakBroker:
             self.logger.warning("Cannot start WebSocket - broker not connected")
             return
         
+        self._start_tick_consumer()
         try:
             # Subscribe to Nifty 50 Index (token 26000) for live spot price
-            nifty_token = "26000"
             self.logger.info(" Starting WebSocket + subscribing to Nifty 50...")
-            self.subscribe_symbol(nifty_token, "nse_cm")
+            self.subscribe_symbol(NIFTY_TOKEN, "nse_cm")
             self.logger.info(" WebSocket started, Nifty 50 subscribed")
         except Exception as e:
             self.logger.error(f" WebSocket startup failed: {e}")
@@ -275,33 +538,40 @@ class KotakBroker:
         if not self.connected:
             return
         
+        # Accumulate, then flush in one subscribe call
+        pairs = []
         for strategy in strategies:
             if strategy.position:
                 symbol = strategy.position.get('symbol', '')
-                if symbol and symbol not in self.subscribed_tokens:
+                if symbol:
                     try:
                         mapping = self.get_instrument_token(symbol)
-                        if mapping:
-                            self.subscribe_symbol(mapping['token'], mapping['segment'])
-                            self.logger.info(f" Subscribed to position symbol: {symbol}")
+                        # subscribed_tokens holds tokens, so the check has to follow resolution
+                        if mapping and mapping['token'] not in self._subscribed_snapshot:
+                            pairs.append((mapping['token'], mapping['segment']))
                     except Exception as e:
                         self.logger.error(f" Subscribe position {symbol} failed: {e}")
+        if pairs:
+            self.subscribe_symbols(pairs)
+            self.logger.info(f" Subscribed to {len(pairs)} position symbol(s)")
 
     def get_instrument_token(self, symbol, exchange_segment="nse_cm"):
         """
         Finds token for a symbol. 
         Symbol format: "SBIN", "RELIANCE", "Nifty 50"
         """
-        if symbol in self.token_map:
-            return self.token_map[symbol]
+        mapping = self.token_map.get(symbol)
+        if mapping is not None:
+            return mapping
             
         try:
             # Clean symbol (remove NSE: prefix etc if present)
-            clean_symbol = symbol.replace("NSE:", "").replace("-EQ", "")
+            clean_symbol = symbol.removeprefix("NSE:").removesuffix("-EQ")
             
             # Manual Override for Nifty 50
-            if "NIFTY" in clean_symbol.upper() and ("50" in clean_symbol or "INDEX" in clean_symbol):
-                 self.token_map[symbol] = {"token": "26000", "segment": "nse_cm"}
+            if clean_symbol.upper().translate(_INDEX_KEY_STRIP) in _INDEX_SYMBOLS:
+                 self.token_map[symbol] = {"token": NIFTY_TOKEN, "segment": "nse_cm"}
+                 self._token_to_symbol[NIFTY_TOKEN] = symbol
                  return self.token_map[symbol]
 
             # Use search_scrip
@@ -309,10 +579,12 @@ class KotakBroker:
             if res and isinstance(res, list) and len(res) > 0:
                 # Find best match
                 target = res[0]
-                token = str(target.get('pSymbol') or target.get('instrumentToken'))
+                token = _to_int_token(target.get('pSymbol') or target.get('instrumentToken'))
                 segment = str(target.get('pExchSeg') or exchange_segment)
                 
-                self.token_map[symbol] = {"token": token, "segment": segment}
+                self.token_map[symbol] = {"token": token, "segment": segment, "ts": time.time()}
+                self._token_to_symbol[token] = symbol
+                self._token_map_dirty = True
                 return self.token_map[symbol]
             else:
                 self.logger.warning(f"Symbol not found: {symbol}")
@@ -323,25 +595,45 @@ class KotakBroker:
 
     def subscribe_symbol(self, token, segment="nse_cm"):
         """Subscribes and waits briefly for data"""
-        if token in self.subscribed_tokens:
+        self.subscribe_symbols([(token, segment)])
+
+    def subscribe_symbols(self, token_segment_pairs):
+        """Subscribes many (token, segment) pairs with a single WS subscribe call"""
+        new = {}
+        for token, segment in token_segment_pairs:
+            token = _to_int_token(token)
+            if token not in self._subscribed_snapshot and token not in new:
+                new[token] = segment
+        if not new:
             return
+        
+        # Registered before subscribing so the first tick can't slip past a waiter
+        for token in new:
+            if token not in self.ltp_cache:
+                self._first_tick_events.setdefault(token, threading.Event())
             
         try:
-            instruments = [{"instrument_token": token, "exchange_segment": segment}]
-            self.logger.info(f" Subscribing to {token}...")
+            instruments = [{"instrument_token": str(t), "exchange_segment": s} for t, s in new.items()]
+            self.logger.info(f" Subscribing to {len(instruments)} token(s): {list(new)}")
             # Detect index? 26000 is index.
             # Experiments show isIndex=True might fail or timeout.
             # Try isIndex=False for nse_cm tokens (even indices).
             is_index = False 
             
             self.api.subscribe(instrument_tokens=instruments, isIndex=is_index, isDepth=False)
-            self.subscribed_tokens.add(token)
+            self.subscribed_tokens.update(new)
+            self._subscribed_snapshot = frozenset(self.subscribed_tokens)
+            if not self._ws_tuned:
+                self._tune_ws_socket()
             
             # Wait a tick for data?
             # time.sleep(0.5) 
             # Better not block too long, but initial sub needs time.
         except Exception as e:
-            self.logger.error(f"Subscribe failed for {token}: {e}")
+            # No feed is coming for these: drop their waiters so the events don't pile up
+            for token in new:
+                self._first_tick_events.pop(token, None)
+            self.logger.error(f"Subscribe failed for {list(new)}: {e}")
 
     def get_current_price(self, symbol):
         """
@@ -356,7 +648,7 @@ class KotakBroker:
         
         # Determine Token
         if isinstance(symbol, dict) and 'instrument_token' in symbol:
-             token = symbol['instrument_token']
+             token = _to_int_token(symbol['instrument_token'])
              segment = symbol.get('exchange_segment', 'nse_cm')
         else:
              mapping = self.get_instrument_token(symbol)
@@ -369,41 +661,116 @@ class KotakBroker:
             
         # Strategy:
         # 1. Check WebSocket Cache
-        if token in self.ltp_cache:
-            return self.ltp_cache[token]
+        price = self.ltp_cache.get(token)
+        if price is not None:
+            return price
             
         # 2. If Nifty/Index, enforce WebSocket Subscription (REST fails)
-        if token == "26000":
+        if token == NIFTY_TOKEN:
             self.subscribe_symbol(token, segment)
-            # Wait max 2s for data
-            for _ in range(10):
-                if token in self.ltp_cache:
-                    return self.ltp_cache[token]
-                time.sleep(0.2)
+            # Wait max 2s for data; woken by the first tick instead of polling
+            price = self._wait_first_tick(token, timeout=2.0)
+            if price is not None:
+                return price
             self.logger.warning(f"WS Data Timeout for {symbol} ({token})")
             return None  # Return None, not 0.0, to prevent false zero-price orders
             
-        # 3. For others, try REST first (immediate), fallback to WS
+        # 3. For others, try REST first (immediate), fallback to WS.
+        # A short TTL + single-flight keeps a burst of callers to one REST round-trip per token.
+        price = self._fresh_rest_quote(token)
+        if price is not None:
+            return price
+        with self._inflight_lock:
+            evt = self._inflight.get(token)
+            leader = evt is None
+            if leader:
+                evt = self._inflight[token] = threading.Event()
+        if not leader:
+            # The leader may have failed; never hand back an expired REST quote
+            evt.wait(timeout=5.0)
+            price = self._fresh_rest_quote(token)
+            return price if price is not None else self.ltp_cache.get(token)
+        try:
+            return self._rest_quote(symbol, token, segment)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(token, None)
+            evt.set()
+
+    def _fresh_rest_quote(self, token):
+        """REST LTP cached for token if younger than REST_QUOTE_TTL_SECS, else None"""
+        cached = self._rest_quotes.get(token)
+        if cached and time.monotonic() - cached[1] < REST_QUOTE_TTL_SECS:
+            return cached[0]
+        return None
+
+    def _rest_quote(self, symbol, token, segment):
+        """REST LTP for one token (TTL-cached in _rest_quotes); WS wait if the quote faults"""
         try:
-            inst_tokens = [{"instrument_token": token, "exchange_segment": segment}]
+            inst_tokens = self._quote_payloads.get(token)
+            if inst_tokens is None or inst_tokens[0]["exchange_segment"] != segment:
+                inst_tokens = [{"instrument_token": str(token), "exchange_segment": segment}]
+                self._quote_payloads[token] = inst_tokens
             quote = self.api.quotes(instrument_tokens=inst_tokens, quote_type="ltp")
             
             if isinstance(quote, list) and len(quote) > 0:
                 item = quote[0]
                 if 'ltp' in item:
+                    # Kept out of ltp_cache (WS-owned, see module docstring); expires after REST_QUOTE_TTL_SECS
                     ltp = float(item['ltp'])
-                    self.ltp_cache[token] = ltp # Update cache too
+                    self._rest_quotes[token] = (ltp, time.monotonic())
                     return ltp
             elif isinstance(quote, dict) and 'fault' in quote:
                  self.logger.warning(f"REST Quote failed, trying WS for {token}")
                  self.subscribe_symbol(token, segment)
-                 pass # Check cache/wait
+                 return self._wait_first_tick(token, timeout=2.0)
                  
         except Exception as e:
             self.logger.error(f"REST Quote Exception {symbol}: {e}")
             
         return self.ltp_cache.get(token)  # Returns None if not found, not 0.0
 
+    def _find_ws_socket(self):
+        """Walks the SDK's WS objects for the raw TCP socket; attribute names vary by SDK version"""
+        frontier, seen = [self.api], set()
+        for _ in range(6):
+            nxt = []
+            for obj in frontier:
+                if obj is None or id(obj) in seen:
+                    continue
+                seen.add(id(obj))
+                if isinstance(obj, socket.socket):
+                    return obj
+                for name in _WS_SOCKET_PATH_ATTRS:
+                    nxt.append(getattr(obj, name, None))
+            frontier = nxt
+        return None
+
+    def _tune_ws_socket(self):
+        """Disable Nagle and enable keep-alive on the feed socket once it exists"""
+        try:
+            sock = self._find_ws_socket()
+            if sock is None:
+                return  # WS not connected yet; retried on the next subscribe
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._ws_tuned = True
+            self.logger.info(" WS socket tuned (TCP_NODELAY, SO_KEEPALIVE)")
+        except Exception as e:
+            self._ws_tuned = True  # don't retry a socket that rejects the options
+            self.logger.warning(f" WS socket tuning skipped: {e}")
+
+    def get_nifty_ltp(self):
+        """Latest Nifty 50 spot from the WS feed (None before the first tick); skips symbol resolution"""
+        return self._nifty_ltp
+
+    def _wait_first_tick(self, token, timeout=2.0):
+        """Blocks until the token's first WS tick (or timeout) and returns its cached LTP"""
+        evt = self._first_tick_events.get(token)
+        if evt is not None:
+            evt.wait(timeout=timeout)
+        return self.ltp_cache.get(token)
+
     def place_order(self, symbol, qty, side, order_type='MARKET', price=0.0, product='MIS'):
         """
         Place order.
@@ -420,11 +787,11 @@ class KotakBroker:
         seg = mapping['segment']
         
         # Map Side
-        txn_type = "B" if side.upper() == "BUY" else "S"
+        txn_type = _TXN_TYPES.get(side) or ("B" if side.upper() == "BUY" else "S")
         
         # Map Order Type
         # settings.py: "Market": "MKT", "Limit": "L"
-        mapped_type = "MKT" if order_type.upper() == "MARKET" else "L"
+        mapped_type = _ORDER_TYPES.get(order_type) or ("MKT" if order_type.upper() == "MARKET" else "L")
         
         try:
              self.logger.info(f"Placing Order: {side} {qty} {symbol} @ {price}")
@@ -450,7 +817,7 @@ class KotakBroker:
                  validity="DAY",
                  trading_symbol=symbol, # Best guess
                  transaction_type=txn_type,
-                 instrument_token=token 
+                 instrument_token=str(token)
              )
              return resp
              
@@ -472,13 +839,17 @@ class KotakBroker:
         positions = self.get_positions()
         if not positions or 'data' not in positions: return
         
+        # Resolved once, not per position
+        target_token = self.get_instrument_token(symbol)
+        if not target_token: return
+        token = target_token['token']
+        
         for pos in positions['data']:
             # Match symbol (TrdSymbol or similar)
             # Need to check response structure of positions()
             # Standard Neo: 'trdSym', 'tks' (token)
             # We filter by token or symbol
-            target_token = self.get_instrument_token(symbol)
-            if target_token and str(pos.get('tok')) == target_token['token']:
+            if _to_int_token(pos.get('tok')) == token:
                 qty = int(pos.get('flBuyQty', 0)) - int(pos.get('flSellQty', 0))
                 if qty != 0:
                      side = "SELL" if qty > 0 else "BUY"
@@ -490,19 +861,24 @@ class KotakBroker:
         positions = self.get_positions()
         if not positions or 'data' not in positions: return
         
-        for pos in positions['data']:
-             qty = int(pos.get('flBuyQty', 0)) - int(pos.get('flSellQty', 0))
-             if qty != 0:
-                 try:
-                     token = pos.get('tok')
-                     # Reverse lookup symbol from token if needed, or place by token if supported?
-                     # place_order needs symbol for logging/search if token not enough.
-                     # We can iterate our token_map to find symbol or jus use 'trdSym'
-                     symbol = pos.get('trdSym') 
-                     side = "SELL" if qty > 0 else "BUY"
-                     self.place_order(symbol, abs(qty), side, order_type="MARKET", product=pos.get('prod', 'MIS'))
-                 except Exception as e:
-                     self.logger.error(f"Failed to close pos {pos}: {e}")
+        # Orders are independent round-trips: fire them concurrently
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(self._close_one, positions['data']))
+
+    def _close_one(self, pos):
+        """Flatten one position row with a market order"""
+        try:
+            qty = int(pos.get('flBuyQty', 0)) - int(pos.get('flSellQty', 0))
+            if qty != 0:
+                # Reverse lookup symbol from token if needed, or place by token if supported?
+                # place_order needs symbol for logging/search if token not enough.
+                # We can iterate our token_map to find symbol or jus use 'trdSym'
+                # Known token -> our symbol, so place_order hits token_map instead of search_scrip
+                symbol = self._token_to_symbol.get(_to_int_token(pos.get('tok'))) or pos.get('trdSym')
+                side = "SELL" if qty > 0 else "BUY"
+                self.place_order(symbol, abs(qty), side, order_type="MARKET", product=pos.get('prod', 'MIS'))
+        except Exception as e:
+            self.logger.error(f"Failed to close pos {pos}: {e}")
 
     def check_token_health(self):
         """Check if session is still alive"""
@@ -534,7 +910,7 @@ class KotakBroker:
         interval = tf_map.get(str(timeframe), 1)
         
         # Ensure subscribed (for future ticks)
-        if token not in self.subscribed_tokens:
+        if token not in self._subscribed_snapshot:
              self.subscribe_symbol(token, mapping.get('segment', 'nse_cm'))
              
         # Fetch from Aggregator
@@ -549,46 +925,37 @@ class KotakBroker:
         if not mapping: return
         token = mapping['token']
         
+        # Resolve the bar datetimes once for the whole frame
+        if isinstance(df.index, pd.DatetimeIndex):
+            dts = df.index.to_pydatetime()
+        elif 'datetime' in df.columns:
+            dts = pd.DatetimeIndex(pd.to_datetime(df['datetime'])).to_pydatetime()
+        elif 'timestamp' in df.columns:
+            dts = np.array([datetime.fromtimestamp(t) for t in df['timestamp'].to_numpy(dtype=np.float64)], dtype=object)
+        else:
+            dts = df.index.to_numpy()
+        
+        # Columns converted in C, no per-row float()/dict
+        ohlc = df[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+        vol = df['volume'].to_numpy(dtype=np.float64) if 'volume' in df.columns else np.zeros(len(df))
+        
         # Determine intervals to prime
         for interval in self.aggregator.intervals:
             # We filter for that interval or just use 1m as base
             if interval == 1:
-                with self.aggregator.lock:
-                    self.aggregator.completed_bars[interval][token] = []
-                    for idx, row in df.iterrows():
-                        # Resolve Datetime
-                        dt = idx
-                        if not hasattr(dt, 'isoformat'):
-                            if 'datetime' in row:
-                                dt = row['datetime']
-                            elif 'timestamp' in row:
-                                try: dt = datetime.fromtimestamp(float(row['timestamp']))
-                                except Exception as e:
-                                    print(f" [WS] Timestamp parse error: {e}")
-                                    dt = datetime.now()
-                        
-                        # Ensure dt is a datetime object
-                        if isinstance(dt, str):
-                            try: dt = datetime.fromisoformat(dt)
-                            except Exception as e:
-                                print(f" [WS] ISO date parse error: {e}")
-
-                        bar = {
-                            'datetime': dt,
-                            'open': float(row['open']),
-                            'high': float(row['high']),
-                            'low': float(row['low']),
-                            'close': float(row['close']),
-                            'volume': float(row.get('volume', 0)),
-                            'bar_key': dt.isoformat() if hasattr(dt, 'isoformat') else str(dt)
-                        }
-                        self.aggregator.completed_bars[interval][token].append(bar)
-                    self.logger.info(f" Aggregator primed with {len(df)} bars for {symbol}")
+                self.aggregator.load_columns(token, interval, dts, ohlc[:, 0], ohlc[:, 1], ohlc[:, 2], ohlc[:, 3], vol)
+                self.logger.info(f" Aggregator primed with {len(df)} bars for {symbol}")
 
     # === Option Helpers ===
-    def get_atm_strike(self, spot_price):
-        """Round to nearest 50"""
-        return round(spot_price / 50) * 50
+    def get_atm_strike(self, spot_price, step=50):
+        """Round to nearest strike step (50 for NIFTY, 100 for BANKNIFTY); ties round up"""
+        return ((int(spot_price) + step // 2) // step) * step
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _build_option_symbol(root, expiry_code, strike, otype):
+        """Cached, interned symbol string so chain polling skips re-formatting"""
+        return sys.intern(f"{root}{expiry_code}{strike}{otype}")
 
     def get_option_price(self, strike, otype, expiry_code):
         """
@@ -598,12 +965,10 @@ class KotakBroker:
         Example: NIFTY + 26217 + 19650 + CE -> NIFTY2621719650CE
         """
         try:
-             # Ensure strike is integer string
-             str_strike = str(int(strike))
-             # Construct symbol
+             # Construct symbol (strike as integer)
              # TODO: Handle BANKNIFTY/FINNIFTY if needed. Assuming NIFTY for now.
              root = "NIFTY" 
-             symbol = f"{root}{expiry_code}{str_strike}{otype.upper()}"
+             symbol = self._build_option_symbol(root, expiry_code, int(strike), _OPTION_TYPES.get(otype) or otype.upper())
              
              # Fetch Price
              price = self.get_current_price(symbol)
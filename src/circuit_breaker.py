@@ -5,6 +5,7 @@ Protects account from catastrophic losses with graduated response.
 """
 
 from typing import Optional, Dict
+from collections import deque
 from datetime import datetime, timedelta
 
 
@@ -25,6 +26,11 @@ class CircuitBreaker:
             'LEVEL_2': {'threshold': -0.05, 'action': 'REDUCE'},    # -5%
             'LEVEL_3': {'threshold': -0.10, 'action': 'LIQUIDATE'}  # -10%
         }
+        # (threshold, name, action), worst first: check_drawdown walks this instead of the dicts
+        self._ordered_levels = tuple(
+            (self.levels[name]['threshold'], name, self.levels[name]['action'])
+            for name in ('LEVEL_3', 'LEVEL_2', 'LEVEL_1')
+        )
         
         # State tracking
         self.current_level = None
@@ -50,28 +56,32 @@ class CircuitBreaker:
         if starting_balance <= 0:
             return None, None
         
+        # Common case: flat or up on the day, no ratio or level walk needed
+        if current_balance >= starting_balance:
+            return None, None
+        
         # Calculate drawdown percentage
         pnl = current_balance - starting_balance
         dd_pct = pnl / starting_balance
         
         # Check levels in order (L3 -> L2 -> L1)
-        for level_name in ['LEVEL_3', 'LEVEL_2', 'LEVEL_1']:
-            level = self.levels[level_name]
-            
-            if dd_pct <= level['threshold']:
-                if self.current_level != level_name:
-                    # New level triggered
-                    self.current_level = level_name
-                    self.breaker_triggered_time = datetime.now()
+        for threshold, level_name, action in self._ordered_levels:
+            if dd_pct <= threshold:
+                # Only the worst breached level counts; milder levels below it must not re-fire
+                if self.current_level == level_name:
+                    return None, None
+                # New level triggered
+                self.current_level = level_name
+                self.breaker_triggered_time = datetime.now()
                     
-                    if self.logger:
-                        self.logger.critical(
-                            f" CIRCUIT BREAKER {level_name}: "
-                            f"Drawdown {dd_pct*100:.2f}% <= {level['threshold']*100:.0f}% | "
-                            f"Action: {level['action']}"
-                        )
+                if self.logger:
+                    self.logger.critical(
+                        f" CIRCUIT BREAKER {level_name}: "
+                        f"Drawdown {dd_pct*100:.2f}% <= {threshold*100:.0f}% | "
+                        f"Action: {action}"
+                    )
                     
-                    return level_name, level['action']
+                return level_name, action
         
         return None, None
     
@@ -164,12 +174,12 @@ class AnomalyDetector:
     def __init__(self, logger=None):
         self.logger = logger
         
-        # Error tracking
-        self.broker_errors = []
+        # Error tracking (last 10 errors; deque evicts the oldest in O(1))
+        self.broker_errors = deque(maxlen=10)
         self.max_consecutive_errors = 3
         
-        # Slippage tracking
-        self.slippage_history = []
+        # Slippage tracking (last 20 fills)
+        self.slippage_history = deque(maxlen=20)
     
     def check_volatility_spike(
         self,
@@ -207,10 +217,6 @@ class AnomalyDetector:
             'time': datetime.now(),
             'error': error_msg
         })
-        
-        # Keep only last 10 errors
-        if len(self.broker_errors) > 10:
-            self.broker_errors.pop(0)
     
     def check_consecutive_errors(self) -> bool:
         """
@@ -222,9 +228,9 @@ class AnomalyDetector:
         if len(self.broker_errors) < self.max_consecutive_errors:
             return False
         
-        # Check if last N errors happened within 5 minutes
-        recent_errors = self.broker_errors[-self.max_consecutive_errors:]
-        time_span = (recent_errors[-1]['time'] - recent_errors[0]['time']).total_seconds()
+        # Check if last N errors happened within 5 minutes (deque: index the ends, no slice)
+        first = self.broker_errors[-self.max_consecutive_errors]
+        time_span = (self.broker_errors[-1]['time'] - first['time']).total_seconds()
         
         if time_span < 300:  # 5 minutes
             if self.logger:
@@ -260,10 +266,6 @@ class AnomalyDetector:
         
         self.slippage_history.append(slippage_pct)
         
-        # Keep only last 20 fills
-        if len(self.slippage_history) > 20:
-            self.slippage_history.pop(0)
-        
         if slippage_pct > max_slippage_pct:
             if self.logger:
                 self.logger.warning(
@@ -1,6 +1,8 @@
 import os
+import numpy as np
 import pandas as pd
 import pytz
+from collections import deque
 from datetime import datetime
 from src.utils.date_utils import get_next_nifty_expiry
 from src.utils.notifications import send_telegram_message
@@ -23,6 +25,8 @@ except ImportError:
 
 INITIAL_CAPITAL = 15000.0
 LOT_SIZE = 65
+MAX_TRADES = 5000  # closed trades kept per strategy (oldest dropped)
+IST = pytz.timezone('Asia/Kolkata')  # built once, shared by every strategy call
 
 class BaseStrategy:
     def __init__(self, name, capital):
@@ -30,7 +34,7 @@ class BaseStrategy:
         self.capital = capital
         self.initial_capital = capital
         self.position = None
-        self.trades = []
+        self.trades = deque(maxlen=MAX_TRADES)
         self.wins = 0
         self.losses = 0
         self.daily_start_capital = capital
@@ -45,12 +49,13 @@ class BaseStrategy:
     def update_market_status(self, df):
         if df is None or len(df) < 2: return
         
-        row = df.iloc[-1]
-        prev = df.iloc[-2]
-        spot = float(row['close'])
-        rsi = float(row.get('rsi', 50))
+        # Last-row scalars straight from the columns; no per-call row Series
+        cols = df.columns
+        spot = float(df['close'].values[-1])
+        rsi = float(df['rsi'].values[-1]) if 'rsi' in cols else 50.0
+        vwap = df['vwap'].values[-1] if 'vwap' in cols else spot
         
-        trend = "Bullish" if spot > row.get('vwap', spot) else "Bearish"
+        trend = "Bullish" if spot > vwap else "Bearish"
         rsi_state = "Overbought" if rsi > 70 else "Oversold" if rsi < 30 else "Neutral"
         
         # Base Narrative
@@ -76,7 +81,7 @@ class BaseStrategy:
             'win_rate': round(win_rate, 1),
             'position': self.position,
             'daily_start_capital': self.daily_start_capital,
-            'trades': self.trades,
+            'trades': list(self.trades),
             'allowed_regimes': self.allowed_regimes
         }
     
@@ -113,37 +118,50 @@ class BaseStrategy:
             return df
             
     def get_recent_swing(self, df, side, lookback=20):
-        if len(df) < 5: return None
+        n = len(df)
+        if n < 5: return None
+        # Candidate pivots are bars start..n-2, each compared with both neighbours
+        start = max(1, n - lookback)
         
         if side == 'buy':
-            lows = df['low'].values
-            for i in range(len(lows) - 2, max(0, len(lows) - lookback - 1), -1):
-                curr = lows[i]
-                prev = lows[i-1]
-                next_val = lows[i+1]
-                if curr < prev and curr < next_val:
-                     return curr
+            seg = df['low'].values[start - 1:]
+            mid = seg[1:-1]
+            idx = np.flatnonzero((mid < seg[:-2]) & (mid < seg[2:]))
+            if idx.size:
+                return mid[idx[-1]]  # most recent swing low
             return df['low'].iloc[-10:-1].min()
 
         elif side == 'sell':
-            highs = df['high'].values
-            for i in range(len(highs) - 2, max(0, len(highs) - lookback - 1), -1):
-                curr = highs[i]
-                prev = highs[i-1]
-                next_val = highs[i+1]
-                if curr > prev and curr > next_val:
-                     return curr
+            seg = df['high'].values[start - 1:]
+            mid = seg[1:-1]
+            idx = np.flatnonzero((mid > seg[:-2]) & (mid > seg[2:]))
+            if idx.size:
+                return mid[idx[-1]]  # most recent swing high
             return df['high'].iloc[-10:-1].max()
             
         return None
 
+    @staticmethod
+    def _option_type_of(symbol):
+        return 'PE' if 'PE' in symbol else ('CE' if 'CE' in symbol else None)
+
+    def _position_option_type(self):
+        """'CE'/'PE'/None for the open position; cached on it (restored positions may predate the flag)"""
+        otype = self.position.get('option_type', False)
+        if otype is False:
+            otype = self._option_type_of(self.position.get('symbol', ''))
+            self.position['option_type'] = otype
+            self.position['is_option'] = otype is not None
+        return otype
+
     def update_trailing_stop(self, df):
         if not self.position: return
         if len(df) < 10: return
         
         side = self.position['side']
-        symbol = self.position.get('symbol', '')
-        is_option = 'CE' in symbol or 'PE' in symbol
+        option_type = self._position_option_type()
+        is_option = option_type is not None
+        is_put = option_type == 'PE'
         
         if is_option and 'spot_stop' not in self.position:
             current_spot = float(df['close'].iloc[-1])
@@ -154,7 +172,7 @@ class BaseStrategy:
         
         # Get Recent Swing Structure (Support for Long, Resistance for Short)
         swing_side = side
-        if is_option and 'PE' in symbol:
+        if is_put:
             swing_side = 'sell' # For Put Buy (Short), look for Swing Highs
             
         structural_level = self.get_recent_swing(df, swing_side, lookback=20)
@@ -165,7 +183,7 @@ class BaseStrategy:
             new_spot_stop = current_spot_stop
             
             if side == 'buy':
-                if 'PE' in symbol: # Put Buy (Short) -> Trail DOWN
+                if is_put: # Put Buy (Short) -> Trail DOWN
                     if structural_level < current_spot_stop:
                         current_high = df['high'].iloc[-1]
                         if structural_level > current_high:
@@ -209,9 +227,8 @@ class BaseStrategy:
     
     def check_spot_trailing_stop(self, df):
         if not self.position: return False
-        symbol = self.position.get('symbol', '')
-        is_option = 'CE' in symbol or 'PE' in symbol
-        if not is_option: return False
+        option_type = self._position_option_type()
+        if option_type is None: return False
         
         spot_stop = self.position.get('spot_stop')
         if not spot_stop: return False
@@ -220,7 +237,7 @@ class BaseStrategy:
         side = self.position['side']
         
         if side == 'buy':
-            if 'PE' in symbol:
+            if option_type == 'PE':
                 if current_spot >= spot_stop: # Put Buy (Short) -> Exit if price RISES to stop
                     return True
             else: # Call Buy (Long) -> Exit if price FALLS to stop
@@ -231,9 +248,9 @@ class BaseStrategy:
                 return True
         return False
 
-    def _get_current_conditions(self, df=None) -> dict:
-        ist = pytz.timezone('Asia/Kolkata')
-        now = datetime.now(ist)
+    def _get_current_conditions(self, df=None, now=None) -> dict:
+        if now is None:
+            now = datetime.now(IST)
         conditions = {
             'strategy': self.name,
             'hour': now.hour,
@@ -241,21 +258,24 @@ class BaseStrategy:
         }
         if df is not None and len(df) > 0:
             try:
-                row = df.iloc[-1]
-                if 'adx' in df.columns: conditions['adx'] = float(row.get('adx', 0))
-                if 'rsi' in df.columns: conditions['rsi'] = float(row.get('rsi', 50))
-                if 'atr' in df.columns and len(df) > 20:
-                    current_atr = float(row.get('atr', 0))
-                    avg_atr = float(df['atr'].tail(20).mean())
+                cols = df.columns
+                if 'adx' in cols: conditions['adx'] = float(df['adx'].values[-1])
+                if 'rsi' in cols: conditions['rsi'] = float(df['rsi'].values[-1])
+                if 'atr' in cols and len(df) > 20:
+                    window = df['atr'].values[-20:]
+                    current_atr = float(window[-1])
+                    window = window[~np.isnan(window)]  # pandas mean() skips NaN too
+                    avg_atr = float(window.mean()) if window.size else 0.0
                     conditions['atr_ratio'] = current_atr / avg_atr if avg_atr > 0 else 1.0
             except Exception as e:
                 print(f" [BRAIN] Condition extraction error: {e}")
         return conditions
     
     def execute_trade(self, entry_price, side, stop, target, size, symbol=None, df=None, skip_brain=False):
-        ist = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(IST)  # one clock read for throttle, entry_time and conditions
+        conditions = None
         if BRAIN_AVAILABLE and brain and not skip_brain:
-            conditions = self._get_current_conditions(df)
+            conditions = self._get_current_conditions(df, now)
             should_skip, skip_reason = brain.should_skip_trade(conditions)
             if should_skip:
                 self.status = f" Warning (Ignored): {skip_reason}"
@@ -276,7 +296,7 @@ class BaseStrategy:
             if last_entry_str:
                 try:
                     last_entry = datetime.fromisoformat(last_entry_str)
-                    if (datetime.now(ist) - last_entry).total_seconds() < 60:
+                    if (now - last_entry).total_seconds() < 60:
                         self.status = " Throttle: Entry blocked (Min 60s between trades)."
                         return None
                 except Exception as e:
@@ -291,11 +311,16 @@ class BaseStrategy:
             'symbol': symbol or self.name,
             'strike': getattr(self, 'current_strike', 'N/A'),
             'ltp': entry_price,
-            'entry_time': datetime.now(ist).isoformat()
+            'entry_time': now.isoformat()
         }
+        # Fixed for the life of the position: computed once here, not per tick
+        option_type = self._option_type_of(self.position['symbol'])
+        self.position['option_type'] = option_type
+        self.position['is_option'] = option_type is not None
         
         if BRAIN_AVAILABLE and brain:
-            self.position['conditions'] = self._get_current_conditions(df)
+            # Same df and clock as the pre-trade check: reuse that dict when it was built
+            self.position['conditions'] = conditions if conditions is not None else self._get_current_conditions(df, now)
 
         display_name = symbol if symbol else self.name
         
@@ -366,8 +391,6 @@ class BaseStrategy:
 
     def close_trade(self, exit_price, reason):
         if self.position:
-            ist = pytz.timezone('Asia/Kolkata')
-            
             # === LIVE EXIT ORDER ===
             if self.broker and hasattr(self.broker, 'place_order') and self.broker.connected:
                 try:
@@ -400,7 +423,7 @@ class BaseStrategy:
             
             trade_record = {
                 'entry_time': self.position['entry_time'],
-                'exit_time': datetime.now(ist).isoformat(),
+                'exit_time': datetime.now(IST).isoformat(),
                 'side': self.position['side'],
                 'entry': self.position['entry'],
                 'exit': exit_price,
@@ -408,10 +431,7 @@ class BaseStrategy:
                 'reason': reason,
                 'strategy': self.name
             }
-            self.trades.append(trade_record)
-            
-            if len(self.trades) > 5000:
-                self.trades = self.trades[-5000:]
+            self.trades.append(trade_record)  # deque evicts the oldest past MAX_TRADES
             
             pnl_status = "PROFIT " if pnl > 0 else "LOSS "
             status_emoji = "" if pnl > 0 else ""
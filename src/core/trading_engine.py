@@ -12,7 +12,8 @@ from typing import List, Dict
 import pandas as pd
 
 # Local Imports
-from src.core.base_strategy import INITIAL_CAPITAL, LOT_SIZE
+from collections import deque
+from src.core.base_strategy import INITIAL_CAPITAL, LOT_SIZE, MAX_TRADES
 from src.brokers.kotak_paper_broker import KotakPaperBroker
 from src.brokers.kotak_broker import KotakBroker
 from src.regime_detector import MarketRegimeGovernor
@@ -60,6 +61,7 @@ class _StubBroker:
     def get_real_balance(self): return 0.0
     def get_account_balance(self): return 0.0
     def get_current_price(self, *a, **kw): return None
+    def get_nifty_ltp(self): return None
     def get_latest_bars(self, *a, **kw): return None
     def get_atm_strike(self, spot): return round(spot / 50) * 50
     def get_option_price(self, *a, **kw): return 0.0
@@ -70,6 +72,7 @@ class _StubBroker:
     def check_token_health(self): return {"status": "error", "message": "Stub broker"}
     def prime_aggregator(self, *a, **kw): pass
     def subscribe_symbol(self, *a, **kw): pass
+    def subscribe_symbols(self, *a, **kw): pass
     def start_websocket(self): pass
 
 class TradingEngine:
@@ -296,7 +299,7 @@ class TradingEngine:
                         if saved.get('position'):
                             strategy.position = saved.get('position')
                             print(f" Recovered open position for {strategy.name}: {strategy.position['symbol']}")
-                        strategy.trades = saved.get('trades', [])
+                        strategy.trades = deque(saved.get('trades', []), maxlen=MAX_TRADES)
                         print(f" Loaded {len(strategy.trades)} trades for {strategy.name}")
 
     def sync_run_status(self):
@@ -687,7 +690,7 @@ class TradingEngine:
             strategy.wins = 0
             strategy.losses = 0
             strategy.position = None
-            strategy.trades = []
+            strategy.trades.clear()
         
         self.save_state()
         print(" Hard Reset Complete.")
@@ -3,13 +3,17 @@ MongoDB Atlas Handler for Trading Bot
 Stores strategy states and trade history in MongoDB
 """
 import os
+import atexit
+import threading
+import time
+import weakref
 from datetime import datetime
 import pytz
 from typing import Dict, List, Optional
 import json
 
 try:
-    from pymongo import MongoClient
+    from pymongo import MongoClient, UpdateOne
     from pymongo.server_api import ServerApi
     from bson import ObjectId
     MONGO_AVAILABLE = True
@@ -17,6 +21,14 @@ except ImportError:
     MONGO_AVAILABLE = False
     print("Warning: pymongo not installed. Using local JSON storage.")
 
+# Queued session updates still pending at interpreter exit are flushed once here
+_LIVE_HANDLERS = weakref.WeakSet()
+
+@atexit.register
+def _flush_pending_at_exit():
+    for handler in list(_LIVE_HANDLERS):
+        handler.flush_session_updates()
+
 
 class MongoDBHandler:
     """
@@ -42,6 +54,14 @@ class MongoDBHandler:
         self.connected = False
         self.local_file = "strategy_data.json"
         
+        # system_config upserts queued by brokers, coalesced per _id and flushed in one bulk_write
+        self._pending_session_updates = {}
+        self._session_lock = threading.Lock()
+        self._session_flush_timer = None
+        self._session_cache = {}  # doc_id -> (doc, fetched_at) for get_fyers_session
+        self._session_retry_delay = 5.0  # seconds before re-flushing after a failed bulk_write
+        _LIVE_HANDLERS.add(self)
+        
         # Initial connection attempt (non-blocking, falls back to local JSON)
         self.connect()
 
@@ -251,6 +271,78 @@ class MongoDBHandler:
                 print(f"MongoDB trades fetch error: {e}")
         return []
     
+    def queue_session_update(self, doc_id: str, fields: Dict, delay: float = 0.25):
+        """
+        Queue a $set upsert on system_config. Updates arriving within `delay`
+        seconds (e.g. several brokers refreshing together) share one bulk_write.
+        """
+        with self._session_lock:
+            self._pending_session_updates.setdefault(doc_id, {}).update(fields)
+            # Write-through so readers in this process see the update before it's flushed
+            cached = self._session_cache.get(doc_id)
+            if cached and cached[0] is not None:
+                self._session_cache[doc_id] = ({**cached[0], **fields}, cached[1])
+            else:
+                self._session_cache.pop(doc_id, None)
+            self._arm_session_flush(delay)
+    
+    def _arm_session_flush(self, delay: float):
+        """Start the flush timer unless one is already pending (caller holds _session_lock)"""
+        if self._session_flush_timer is None:
+            self._session_flush_timer = threading.Timer(delay, self.flush_session_updates)
+            self._session_flush_timer.daemon = True
+            self._session_flush_timer.start()
+    
+    def get_fyers_session(self, ttl: float = 60) -> Optional[Dict]:
+        """
+        system_config fyers_session doc, memoized for `ttl` seconds so several
+        brokers connecting together share one find_one.
+        """
+        cached = self._session_cache.get("fyers_session")
+        if cached and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+        if not self.connected:
+            return None
+        doc = self.db["system_config"].find_one({"_id": "fyers_session"})
+        self._session_cache["fyers_session"] = (doc, time.monotonic())
+        return doc
+    
+    def invalidate_fyers_session(self):
+        """Drop the memoized fyers_session doc"""
+        self._session_cache.pop("fyers_session", None)
+    
+    def flush_session_updates(self) -> bool:
+        """
+        Write all queued system_config updates in a single unordered bulk_write.
+        On failure the updates are merged back into the queue (newer fields win)
+        and retried, so the write-through cache never serves a lost update.
+        """
+        with self._session_lock:
+            pending = self._pending_session_updates
+            self._pending_session_updates = {}
+            if self._session_flush_timer is not None:
+                self._session_flush_timer.cancel()
+                self._session_flush_timer = None
+        
+        if not pending:
+            return False
+        if self.connected:
+            try:
+                ops = [UpdateOne({"_id": doc_id}, {"$set": fields}, upsert=True)
+                       for doc_id, fields in pending.items()]
+                self.db["system_config"].bulk_write(ops, ordered=False)
+                return True
+            except Exception as e:
+                print(f"MongoDB session flush error (re-queued {len(pending)} updates): {e}")
+        
+        with self._session_lock:
+            for doc_id, fields in pending.items():
+                newer = self._pending_session_updates.get(doc_id, {})
+                self._pending_session_updates[doc_id] = {**fields, **newer}
+            if self.connected:
+                self._arm_session_flush(self._session_retry_delay)
+        return False
+    
     def _save_local(self, data: Dict) -> bool:
         """Save to local JSON file"""
         try:
@@ -273,6 +365,7 @@ class MongoDBHandler:
     
     def close(self):
         """Close MongoDB connection"""
+        self.flush_session_updates()
         if self.client:
             self.client.close()
             print("MongoDB connection closed")
@@ -61,25 +61,26 @@ class OIAnalyzer:
         
         chain_data = {}
         
-        # Fetch strikes from ATM - CHAIN_RANGE to ATM + CHAIN_RANGE
-        for i in range(-self.CHAIN_RANGE, self.CHAIN_RANGE + 1):
-            strike = atm_strike + (i * self.STRIKE_INTERVAL)
+        # Fetch strikes from ATM - CHAIN_RANGE to ATM + CHAIN_RANGE in one batched quote
+        strikes = [atm_strike + (i * self.STRIKE_INTERVAL) for i in range(-self.CHAIN_RANGE, self.CHAIN_RANGE + 1)]
+        try:
+            premiums = self.fyers.fyers.get_option_chain_batch(
+                [(strike, otype) for strike in strikes for otype in ('CE', 'PE')], expiry_date
+            )
+        except Exception as e:
+            self.logger.debug(f"Failed to fetch OI chain around {atm_strike}: {e}")
+            premiums = {}
+        
+        for strike in strikes:
+            ce_premium = premiums.get((strike, 'CE'))
+            pe_premium = premiums.get((strike, 'PE'))
             
-            try:
-                # Get CE data
-                ce_premium = self.fyers.fyers.get_option_chain(strike, 'CE', expiry_date)
-                pe_premium = self.fyers.fyers.get_option_chain(strike, 'PE', expiry_date)
-                
-                chain_data[strike] = {
-                    'ce_ltp': ce_premium or 0,
-                    'pe_ltp': pe_premium or 0,
-                    'ce_oi': self._estimate_oi_from_premium(ce_premium, strike, spot_price, 'CE'),
-                    'pe_oi': self._estimate_oi_from_premium(pe_premium, strike, spot_price, 'PE')
-                }
-                
-            except Exception as e:
-                self.logger.debug(f"Failed to fetch OI for strike {strike}: {e}")
-                continue
+            chain_data[strike] = {
+                'ce_ltp': ce_premium or 0,
+                'pe_ltp': pe_premium or 0,
+                'ce_oi': self._estimate_oi_from_premium(ce_premium, strike, spot_price, 'CE'),
+                'pe_oi': self._estimate_oi_from_premium(pe_premium, strike, spot_price, 'PE')
+            }
         
         # Update cache
         self.oi_cache = chain_data
@@ -1,27 +1,87 @@
 import threading
 from datetime import datetime
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 
+MAX_BARS = 1500  # completed bars kept per symbol/interval (approx 1 day for 1m)
+
+class BarRing:
+    """
+    Fixed-size column-major (SoA) ring buffer of completed bars.
+    One preallocated numpy column per field, so get_bars_df slices instead of looping rows.
+    """
+    __slots__ = ('size', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'idx', 'n')
+
+    def __init__(self, size=MAX_BARS):
+        self.size = size
+        self.datetime = np.empty(size, dtype=object)
+        self.open = np.empty(size)
+        self.high = np.empty(size)
+        self.low = np.empty(size)
+        self.close = np.empty(size)
+        self.volume = np.empty(size)
+        self.idx = 0  # next write slot
+        self.n = 0    # bars stored
+
+    def __len__(self):
+        return self.n
+
+    def append(self, bar):
+        """Store a bar dict ('datetime','open','high','low','close','volume'), overwriting the oldest when full"""
+        i = self.idx
+        self.datetime[i] = bar['datetime']
+        self.open[i] = bar['open']
+        self.high[i] = bar['high']
+        self.low[i] = bar['low']
+        self.close[i] = bar['close']
+        self.volume[i] = bar['volume']
+        self.idx = (i + 1) % self.size
+        if self.n < self.size:
+            self.n += 1
+
+    def load_columns(self, datetimes, opens, highs, lows, closes, volumes):
+        """Bulk-fill from equal-length arrays (oldest first); keeps the newest `size` rows"""
+        n = min(len(opens), self.size)
+        if n:
+            self.datetime[:n] = datetimes[-n:]
+            self.open[:n] = opens[-n:]
+            self.high[:n] = highs[-n:]
+            self.low[:n] = lows[-n:]
+            self.close[:n] = closes[-n:]
+            self.volume[:n] = volumes[-n:]
+        self.n = n
+        self.idx = n % self.size
+
+    def tail_indices(self, k):
+        """Slot indices of the last k bars, oldest first"""
+        k = max(0, min(k, self.n))
+        return (self.idx - k + np.arange(k)) % self.size
+
 class BarAggregator:
     """
     Aggregates real-time ticks into OHLC bars (1m, 5m intervals)
     Generic implementation extracted from FyersWSHandler.
     """
-    def __init__(self, intervals=[1, 5]):
+    def __init__(self, intervals=[1, 5], max_bars=MAX_BARS):
         """
         Args:
             intervals: List of minute intervals to aggregate (e.g., [1, 5])
+            max_bars: Completed bars kept per symbol/interval (oldest evicted)
         """
         self.intervals = intervals  # Minutes
+        self.max_bars = max_bars
         self.current_bars = {}  # {interval: {symbol: {'open':, 'high':, 'low':, 'close':, 'volume':, 'start_time':}}}
-        self.completed_bars = {}  # {interval: {symbol: [list of completed bars]}}
+        self.completed_bars = {}  # {interval: {symbol: BarRing of completed bars}}
         self.lock = threading.Lock()
         
         for interval in intervals:
             self.current_bars[interval] = {}
-            self.completed_bars[interval] = defaultdict(list)
+            self.completed_bars[interval] = defaultdict(self._new_ring)
     
+    def _new_ring(self):
+        return BarRing(self.max_bars)
+
     def _get_bar_start_time(self, timestamp, interval_minutes):
         """Get the start time of the current bar interval"""
         dt = datetime.fromtimestamp(timestamp) if isinstance(timestamp, (int, float)) else timestamp
@@ -42,15 +102,61 @@ class BarAggregator:
         Returns:
             Dict of completed bars by interval if any bar closed, else None
         """
-        completed = {}
+        bar_starts = self._bar_starts(timestamp)
+        with self.lock:
+            completed = self._update_locked(symbol, ltp, volume, bar_starts)
+        
+        return completed if completed else None
+    
+    def process_ticks_batch(self, symbols, ltps, volumes, timestamp):
+        """
+        Process a whole WebSocket frame of ticks sharing one timestamp.
+        Bar boundaries are computed once and the lock is taken once per frame.
         
+        Returns:
+            {symbol: {interval: completed_bar}} for symbols whose bar closed
+        """
+        bar_starts = self._bar_starts(timestamp)
+        completed = {}
         with self.lock:
-            for interval in self.intervals:
-                bar_start = self._get_bar_start_time(timestamp, interval)
-                bar_key = bar_start.isoformat()
+            for symbol, ltp, volume in zip(symbols, ltps, volumes):
+                closed = self._update_locked(symbol, ltp, volume, bar_starts)
+                if closed:
+                    completed[symbol] = closed
+        return completed
+    
+    def _bar_starts(self, timestamp):
+        """(interval, bar_start, bar_key) for every interval at this timestamp"""
+        result = []
+        for interval in self.intervals:
+            bar_start = self._get_bar_start_time(timestamp, interval)
+            result.append((interval, bar_start, bar_start.isoformat()))
+        return result
+    
+    def _update_locked(self, symbol, ltp, volume, bar_starts):
+        """Apply one tick to every interval; caller holds self.lock"""
+        completed = {}
+        for interval, bar_start, bar_key in bar_starts:
+            if symbol not in self.current_bars[interval]:
+                # First tick for this symbol/interval
+                self.current_bars[interval][symbol] = {
+                    'datetime': bar_start,
+                    'open': ltp,
+                    'high': ltp,
+                    'low': ltp,
+                    'close': ltp,
+                    'volume': volume or 0,
+                    'bar_key': bar_key
+                }
+            else:
+                current = self.current_bars[interval][symbol]
                 
-                if symbol not in self.current_bars[interval]:
-                    # First tick for this symbol/interval
+                # Check if we're in a new bar
+                if bar_key != current['bar_key']:
+                    # Complete the old bar (ring keeps only the last MAX_BARS)
+                    self.completed_bars[interval][symbol].append(current)
+                    
+                    # Start new bar
                     self.current_bars[interval][symbol] = {
                         'datetime': bar_start,
                         'open': ltp,
@@ -60,39 +166,40 @@ class BarAggregator:
                         'volume': volume or 0,
                         'bar_key': bar_key
                     }
-                else:
-                    current = self.current_bars[interval][symbol]
                     
-                    # Check if we're in a new bar
-                    if bar_key != current['bar_key']:
-                        # Complete the old bar
-                        self.completed_bars[interval][symbol].append(current.copy())
-                        
-                        # Keep only last 1500 bars per symbol (approx 1 day for 1m)
-                        if len(self.completed_bars[interval][symbol]) > 1500:
-                            self.completed_bars[interval][symbol] = self.completed_bars[interval][symbol][-1500:]
-                        
-                        # Start new bar
-                        self.current_bars[interval][symbol] = {
-                            'datetime': bar_start,
-                            'open': ltp,
-                            'high': ltp,
-                            'low': ltp,
-                            'close': ltp,
-                            'volume': volume or 0,
-                            'bar_key': bar_key
-                        }
-                        
-                        completed[interval] = current.copy()
-                    else:
-                        # Update current bar
-                        current['high'] = max(current['high'], ltp)
-                        current['low'] = min(current['low'], ltp)
-                        current['close'] = ltp
-                        current['volume'] += volume or 0
-        
-        return completed if completed else None
+                    completed[interval] = current.copy()
+                else:
+                    # Update current bar
+                    current['high'] = max(current['high'], ltp)
+                    current['low'] = min(current['low'], ltp)
+                    current['close'] = ltp
+                    current['volume'] += volume or 0
+        return completed
     
+    def load_columns(self, symbol, interval, datetimes, opens, highs, lows, closes, volumes):
+        """Replace completed bars for symbol/interval from column arrays (vectorized priming)"""
+        # Built outside the lock; the critical section is just the merge + swap
+        ring = self._new_ring()
+        ring.load_columns(datetimes, opens, highs, lows, closes, volumes)
+        with self.lock:
+            live = self.completed_bars[interval].get(symbol)
+            if live and ring.n:
+                self._merge_newer(ring, live)
+            self.completed_bars[interval][symbol] = ring
+
+    @staticmethod
+    def _merge_newer(ring, live):
+        """Carry over bars the live feed completed after the last primed bar"""
+        last = ring.datetime[(ring.idx - 1) % ring.size]
+        for i in live.tail_indices(live.n):
+            try:
+                newer = live.datetime[i] > last
+            except TypeError:  # naive vs aware datetimes: can't order, keep the primed history
+                return
+            if newer:
+                ring.append({'datetime': live.datetime[i], 'open': live.open[i], 'high': live.high[i],
+                             'low': live.low[i], 'close': live.close[i], 'volume': live.volume[i]})
+
     def get_bars_df(self, symbol, interval, limit=100):
         """
         Get completed bars as DataFrame
@@ -106,7 +213,7 @@ class BarAggregator:
             DataFrame with OHLC data
         """
         with self.lock:
-            bars = self.completed_bars.get(interval, {}).get(symbol, [])
+            bars = self.completed_bars.get(interval, {}).get(symbol)
             
             if not bars:
                 # Return empty DF with correct columns
@@ -120,11 +227,16 @@ class BarAggregator:
             # But indicators might want current.
             # Let's include current for now as per original implementation.
             current = self.current_bars.get(interval, {}).get(symbol)
-            all_bars = bars[-limit:] + ([current] if current else [])
-            
-            df = pd.DataFrame(all_bars)
-            if 'datetime' in df.columns:
-                df.set_index('datetime', inplace=True)
-                df.drop(columns=['bar_key'], errors='ignore', inplace=True)
+            # Gather columns with one fancy-index per field; current bar (if any) is the last row
+            sel = bars.tail_indices(limit - 1 if current else limit)
+            columns = {}
+            for name in ('open', 'high', 'low', 'close', 'volume'):
+                col = getattr(bars, name)[sel]
+                if current:
+                    col = np.append(col, current[name])
+                columns[name] = col
+            dts = bars.datetime[sel]
+            if current:
+                dts = np.append(dts, current['datetime'])
             
-            return df.tail(limit)
+            return pd.DataFrame(columns, index=pd.Index(dts, name='datetime'))
@@ -0,0 +1,63 @@
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from src.utils.bar_aggregator import BarAggregator, BarRing
+
+# Offline checks of the column-major bar ring and history priming
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T0 = datetime(2026, 2, 10, 9, 15)
+
+
+def _bar(i, price=None):
+    price = 100.0 + i if price is None else price
+    return {'datetime': T0 + timedelta(minutes=i), 'open': price, 'high': price + 1,
+            'low': price - 1, 'close': price, 'volume': 10.0}
+
+
+def test_ring_wraps_oldest_first():
+    ring = BarRing(3)
+    for i in range(5):
+        ring.append(_bar(i))
+    assert len(ring) == 3 and ring.idx == 2
+    sel = ring.tail_indices(3)
+    assert list(ring.close[sel]) == [102.0, 103.0, 104.0]
+    assert list(ring.close[ring.tail_indices(10)]) == [102.0, 103.0, 104.0]
+    assert list(ring.close[ring.tail_indices(1)]) == [104.0]
+    assert len(ring.tail_indices(0)) == 0
+
+
+def test_ring_load_columns_keeps_newest():
+    ring = BarRing(3)
+    closes = np.arange(5, dtype=float)
+    ring.load_columns(np.array([T0 + timedelta(minutes=i) for i in range(5)], dtype=object),
+                      closes, closes, closes, closes, closes)
+    assert len(ring) == 3 and ring.idx == 0
+    assert list(ring.close[ring.tail_indices(3)]) == [2.0, 3.0, 4.0]
+    ring.append(_bar(5, price=5.0))  # next write overwrites the oldest primed row
+    assert list(ring.close[ring.tail_indices(3)]) == [3.0, 4.0, 5.0]
+
+
+def test_load_columns_merges_newer_live_bars():
+    agg = BarAggregator(intervals=[1], max_bars=10)
+    # Live feed completes 09:16 and 09:17 while history (up to 09:16) is being fetched
+    for i, price in ((1, 500.0), (2, 600.0), (3, 700.0)):
+        agg.process_tick("NIFTY", price, 1, T0 + timedelta(minutes=i, seconds=5))
+
+    history = [_bar(i) for i in range(2)]  # 09:15, 09:16
+    agg.load_columns("NIFTY", 1,
+                     np.array([b['datetime'] for b in history], dtype=object),
+                     *(np.array([b[k] for b in history]) for k in ('open', 'high', 'low', 'close', 'volume')))
+
+    df = agg.get_bars_df("NIFTY", 1, limit=10)
+    assert list(df.index) == [T0 + timedelta(minutes=i) for i in range(4)]
+    # 09:16 comes from history, 09:17 from the live feed, 09:18 is the bar still forming
+    assert list(df['close']) == [100.0, 101.0, 600.0, 700.0]
+
+
+if __name__ == "__main__":
+    test_ring_wraps_oldest_first()
+    test_ring_load_columns_keeps_newest()
+    test_load_columns_merges_newer_live_bars()
+    logger.info(" Bar aggregator checks passed")
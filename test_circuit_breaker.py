@@ -0,0 +1,40 @@
+import logging
+from src.circuit_breaker import CircuitBreaker
+
+# Offline checks of the graduated drawdown levels
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+START = 100000.0
+
+
+def test_flat_or_up_never_triggers():
+    breaker = CircuitBreaker(logger=logger)
+    assert breaker.check_drawdown(START, START) == (None, None)
+    assert breaker.check_drawdown(START * 1.05, START) == (None, None)
+    assert breaker.check_drawdown(START, 0) == (None, None)
+    assert breaker.current_level is None
+
+
+def test_escalates_one_level_at_a_time():
+    breaker = CircuitBreaker(logger=logger)
+    assert breaker.check_drawdown(START * 0.97, START) == ('LEVEL_1', 'PAUSE')
+    assert breaker.check_drawdown(START * 0.97, START) == (None, None)
+    assert breaker.check_drawdown(START * 0.94, START) == ('LEVEL_2', 'REDUCE')
+    assert breaker.check_drawdown(START * 0.89, START) == ('LEVEL_3', 'LIQUIDATE')
+
+
+def test_deep_drawdown_does_not_oscillate():
+    breaker = CircuitBreaker(logger=logger)
+    assert breaker.check_drawdown(START * 0.85, START) == ('LEVEL_3', 'LIQUIDATE')
+    # Repeated checks past -10% used to alternate LEVEL_2 / LEVEL_3
+    for _ in range(5):
+        assert breaker.check_drawdown(START * 0.85, START) == (None, None)
+        assert breaker.current_level == 'LEVEL_3'
+
+
+if __name__ == "__main__":
+    test_flat_or_up_never_triggers()
+    test_escalates_one_level_at_a_time()
+    test_deep_drawdown_does_not_oscillate()
+    logger.info(" Circuit breaker checks passed")
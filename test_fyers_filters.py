@@ -0,0 +1,83 @@
+import logging
+from src.brokers.fyers_broker import FyersBroker, _is_valid_expiry
+
+# Offline checks: no Fyers login, only the pre-quote filters
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_is_valid_expiry():
+    assert _is_valid_expiry("26210")      # Tue 10 Feb 2026
+    assert _is_valid_expiry("24D26")      # Thu 26 Dec 2024
+    # Holiday-shifted weeklies land on the previous trading day
+    assert _is_valid_expiry("25O01")      # Wed 01 Oct 2025
+    assert _is_valid_expiry("26302")      # Mon 02 Mar 2026
+    assert _is_valid_expiry("26JAN")      # Monthly code
+    assert not _is_valid_expiry("26207")  # Saturday
+    assert not _is_valid_expiry("26208")  # Sunday
+    assert not _is_valid_expiry("26230")  # 30 Feb
+    assert not _is_valid_expiry("2621")   # Wrong length
+    assert not _is_valid_expiry(None)
+
+
+def test_invalid_expiry_warns_once():
+    handler = _CountingHandler()
+    broker_logger = logging.getLogger("test_fyers_filters.broker")
+    broker_logger.addHandler(handler)
+    broker = FyersBroker(logger=broker_logger)
+
+    for strike in range(25000, 26050, 50):
+        for otype in ("CE", "PE"):
+            assert not broker._is_valid_contract(strike, otype, "26207")
+
+    warnings = [r for r in handler.records if "Invalid option expiry" in r.getMessage()]
+    assert len(warnings) == 1, f"expected one warning, got {len(warnings)}"
+
+
+def test_filter_tick_index_spike():
+    broker = FyersBroker(logger=logger)
+    sym = "NSE:NIFTY50-INDEX"
+    assert broker._filter_tick(sym, 25000.0) == 25000.0
+    assert broker._filter_tick(sym, 25050.0) == 25050.0
+    assert broker._filter_tick(sym, 0) == 25050.0           # garbage quote
+    assert broker._filter_tick(sym, 2505.0) == 25050.0      # one-off spike rejected
+    assert broker._filter_tick(sym, 40000.0) == 25050.0     # far from the suspect: still rejected
+    assert broker._filter_tick(sym, 40100.0) == 40100.0     # near the suspect: confirmed
+    assert sym not in broker._suspect_ticks
+
+
+def test_filter_tick_spike_then_normal():
+    broker = FyersBroker(logger=logger)
+    sym = "NSE:NIFTY50-INDEX"
+    broker._filter_tick(sym, 25000.0)
+    assert broker._filter_tick(sym, 50000.0) == 25000.0
+    assert broker._filter_tick(sym, 25010.0) == 25010.0     # back to normal clears the suspect
+    assert sym not in broker._suspect_ticks
+    assert broker._filter_tick(sym, 50000.0) == 25010.0     # a lone spike needs fresh confirmation
+
+
+def test_filter_tick_options_not_held_back():
+    broker = FyersBroker(logger=logger)
+    sym = "NSE:NIFTY2621025500CE"
+    assert broker._filter_tick(sym, 10.0) == 10.0
+    assert broker._filter_tick(sym, 18.0) == 18.0           # +80% premium move passes through
+    assert broker._filter_tick(sym, 4.0) == 4.0
+    assert broker._filter_tick(sym, None) == 4.0
+
+
+if __name__ == "__main__":
+    test_is_valid_expiry()
+    test_invalid_expiry_warns_once()
+    test_filter_tick_index_spike()
+    test_filter_tick_spike_then_normal()
+    test_filter_tick_options_not_held_back()
+    logger.info(" Fyers filter checks passed")
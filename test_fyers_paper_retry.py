@@ -0,0 +1,60 @@
+import logging
+from src.brokers.fyers_paper_broker import FyersPaperBroker
+
+# Offline checks of the paper broker's retry loop against canned Fyers responses
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Quotes:
+    """Stand-in for FyersModel.quotes: replays `responses`, repeating the last one"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def quotes(self, data):
+        self.calls += 1
+        return self.responses[min(self.calls, len(self.responses)) - 1]
+
+
+def _paper(*responses):
+    paper = FyersPaperBroker(logger=logger)
+    paper.retry_config.update(base_delay=0.01, max_delay=0.02)
+    paper.fyers.connected = True
+    paper.fyers.api = _Quotes(*responses)
+    return paper
+
+
+def test_auth_error_aborts_without_retry():
+    paper = _paper({"s": "error", "code": -16, "message": "Could not authenticate the user"})
+    assert paper.get_current_price("NSE:NIFTY50-INDEX") is None
+    assert paper.fyers.api.calls == 1
+    assert paper.fyers.last_auth_error == -16
+    assert paper.stats['api_retries'] == 0
+
+
+def test_none_results_back_off_then_recover():
+    sleeps = []
+    paper = _paper(
+        {"s": "error", "code": 500, "message": "server error"},
+        {"s": "ok", "d": [{"n": "NSE:NIFTY50-INDEX", "v": {"lp": 25000.0}}]},
+    )
+    paper._retry_delay = lambda attempt: sleeps.append(attempt) or 0.0
+    assert paper.get_current_price("NSE:NIFTY50-INDEX") == 25000.0
+    assert paper.fyers.api.calls == 2
+    assert sleeps == [0]  # the None result was retried after a backoff
+    assert paper.fyers.last_auth_error is None
+
+
+def test_gives_up_after_max_retries():
+    paper = _paper({"s": "error", "code": 500, "message": "server error"})
+    assert paper.get_current_price("NSE:NIFTY50-INDEX") is None
+    assert paper.fyers.api.calls == paper.retry_config['max_retries']
+
+
+if __name__ == "__main__":
+    test_auth_error_aborts_without_retry()
+    test_none_results_back_off_then_recover()
+    test_gives_up_after_max_retries()
+    logger.info(" Paper broker retry checks passed")
@@ -0,0 +1,144 @@
+import json
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from fyers_apiv3 import fyersModel
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from src.brokers import fyers_broker
+from src.brokers.fyers_broker import FyersBroker
+
+# Offline check that Fyers SDK REST calls ride the shared pooled session
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _RecordingAdapter(BaseAdapter):
+    """Answers every request with {'s': 'ok'} and remembers the URLs"""
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps({"s": "ok"}).encode()
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def test_sdk_calls_use_pooled_session():
+    session = fyers_broker._HTTP_SESSION
+    adapter = _RecordingAdapter()
+    original = session.adapters["https://"]
+    session.mount("https://", adapter)
+    try:
+        broker = FyersBroker(logger=logger)
+        assert broker.uses_pooled_http()  # before connect: the SDK module patch
+        broker.app_id = "TEST-100"
+        api = broker._use_token("header.payload.signature")
+        assert broker.uses_pooled_http()
+
+        assert api.get_profile() == {"s": "ok"}
+        assert len(adapter.urls) == 1 and "profile" in adapter.urls[0]
+    finally:
+        session.mount("https://", original)
+
+
+class _Always503(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        self.send_response(503)
+        self.end_headers()
+        self.wfile.write(b"Service Unavailable")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_exhausted_retries_reach_sdk_error_handling():
+    server = HTTPServer(("127.0.0.1", 0), _Always503)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = fyers_broker._HTTP_SESSION
+    pooled = session.adapters["https://"]
+    retry = pooled.max_retries
+    original_api = fyersModel.Config.API
+    try:
+        # Same adapter and Retry policy, over plain HTTP and without the backoff sleeps
+        pooled.max_retries = retry.new(backoff_factor=0)
+        session.mount("http://", pooled)
+        fyersModel.Config.API = f"http://127.0.0.1:{server.server_port}/api/v3"
+
+        broker = FyersBroker(logger=logger)
+        broker.app_id = "TEST-100"
+        response = broker._use_token("header.payload.signature").get_profile()
+
+        # The final 503 comes back as the SDK's error dict instead of RetryError
+        assert response.get("s") == "error" and response.get("code") == 503
+        assert _Always503.hits == retry.total + 1
+    finally:
+        fyersModel.Config.API = original_api
+        pooled.max_retries = retry
+        session.mount("http://", fyers_broker.HTTPAdapter())
+        server.shutdown()
+
+
+class _Quotes(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the Fyers data API
+    peers = set()
+
+    def do_GET(self):
+        type(self).peers.add(self.client_address)
+        body = json.dumps({"s": "ok", "d": [{"n": "NSE:NIFTY50-INDEX", "v": {"lp": 25000.0}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_quotes_reuse_one_connection():
+    server = HTTPServer(("127.0.0.1", 0), _Quotes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    original_api = fyersModel.Config.DATA_API
+    broker = FyersBroker(logger=logger)
+    broker.app_id = "TEST-100"
+    broker._use_token("header.payload.signature")
+    broker.connected = True
+
+    async def run():
+        prices = []
+        for _ in range(5):  # sequential, so every call can pick up the idle connection
+            prices.append(await broker.get_current_price_async("NSE:NIFTY50-INDEX"))
+        session = broker._async_session
+        await broker.aclose()
+        return prices, session
+
+    try:
+        fyersModel.Config.DATA_API = f"http://127.0.0.1:{server.server_port}/data"
+        prices, session = asyncio.run(run())
+        assert prices == [25000.0] * 5
+        assert session.closed and broker._async_session is None
+        assert len(_Quotes.peers) == 1  # one TCP connection served all five quotes
+    finally:
+        fyersModel.Config.DATA_API = original_api
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_sdk_calls_use_pooled_session()
+    test_exhausted_retries_reach_sdk_error_handling()
+    test_async_quotes_reuse_one_connection()
+    logger.info(" Fyers pooled session check passed")
@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import base64
+import logging
+import tempfile
+from src.brokers.fyers_broker import FyersBroker, _TokenCache
+
+# Offline checks of the process-wide Fyers token cache and JWT expiry decoding
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).rstrip(b"=").decode()
+    return f"header.{payload}.signature"
+
+
+def test_token_expiry_decoded_and_cached():
+    broker = FyersBroker(logger=logger)
+    exp = int(time.time()) + 3600
+    token = _jwt(exp)
+
+    expiry = broker._get_token_expiry(token)
+    assert int(expiry.timestamp()) == exp
+    assert _TokenCache.get_expiry(token) is expiry
+    assert broker._token_is_fresh(token)
+    assert not broker._token_is_fresh(token, skew=7200)
+
+    stale = _jwt(int(time.time()) - 10)
+    assert not broker._token_is_fresh(stale)
+    assert broker._get_token_expiry("not-a-jwt") is None
+    assert not broker._token_is_fresh(None)
+
+
+def test_env_wins_and_file_changes_are_seen():
+    cwd = os.getcwd()
+    saved_env = os.environ.pop("FYERS_ACCESS_TOKEN", None)
+    saved_tokens = dict(_TokenCache._tokens)
+    _TokenCache._tokens.pop("access", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            assert _TokenCache.get_access() is None  # a miss is not cached
+            with open(".fyers_token", "w") as f:
+                f.write("file-token\n")
+            assert _TokenCache.get_access() == "file-token"
+
+            # Rewritten outside _persist_tokens (e.g. /api/save_token): new mtime, new token
+            with open(".fyers_token", "w") as f:
+                f.write("saved-token\n")
+            os.utime(".fyers_token", ns=(time.time_ns(), time.time_ns() + 10**9))
+            assert _TokenCache.get_access() == "saved-token"
+
+            os.remove(".fyers_token")
+            assert _TokenCache.get_access() == "saved-token"  # served from memory
+
+            os.environ["FYERS_ACCESS_TOKEN"] = "env-token"
+            assert _TokenCache.get_access() == "env-token"
+        finally:
+            os.chdir(cwd)
+            os.environ.pop("FYERS_ACCESS_TOKEN", None)
+            if saved_env is not None:
+                os.environ["FYERS_ACCESS_TOKEN"] = saved_env
+            _TokenCache._tokens.clear()
+            _TokenCache._tokens.update(saved_tokens)
+
+
+if __name__ == "__main__":
+    test_token_expiry_decoded_and_cached()
+    test_env_wins_and_file_changes_are_seen()
+    logger.info(" Fyers token cache checks passed")
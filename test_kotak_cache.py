@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import queue
+import logging
+import tempfile
+import threading
+from src.brokers import kotak_broker
+from src.brokers.kotak_broker import KotakBroker, _WriteOrderedCache
+
+# Offline checks of KotakBroker's caches (no Neo login, no WebSocket)
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_token_map_save_merges_instances():
+    original = kotak_broker.TOKEN_MAP_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        path = kotak_broker.TOKEN_MAP_FILE = os.path.join(tmp, "token_map.json")
+        now = time.time()
+        a = KotakBroker(logger=logger)
+        b = KotakBroker(logger=logger)
+
+        a.token_map["NIFTY26FEB25500CE"] = {"token": 111, "segment": "nse_fo", "ts": now}
+        a._token_map_dirty = True
+        b.token_map["NIFTY26FEB25500PE"] = {"token": 222, "segment": "nse_fo", "ts": now}
+        b.token_map["NIFTY26FEB25500CE"] = {"token": 999, "segment": "nse_fo", "ts": now - 60}
+        b._token_map_dirty = True
+
+        a._save_token_map()
+        b._save_token_map()  # saved last, but must not clobber a's entry or its newer CE row
+
+        with open(path) as f:
+            saved = json.load(f)
+        kotak_broker.TOKEN_MAP_FILE = original
+        assert saved["NIFTY26FEB25500PE"]["token"] == 222
+        assert saved["NIFTY26FEB25500CE"]["token"] == 111
+
+
+def test_ltp_cache_reads_do_not_reorder():
+    cache = _WriteOrderedCache(3)
+    cache.put_many([(1, 10.0), (2, 20.0), (3, 30.0)])
+    before = list(cache)
+    assert cache.get(1) == 10.0 and cache[1] == 10.0
+    assert list(cache) == before  # reads leave write order untouched
+
+    cache.put_many([(4, 40.0)])
+    assert 1 not in cache  # oldest write is evicted even though it was just read
+    assert cache.get(1) is None
+
+
+class _SlowQuotes:
+    """Stand-in for NeoAPI.quotes: counts calls, answers (or fails) after a delay"""
+
+    def __init__(self, ltp=None, delay=0.2):
+        self.ltp = ltp
+        self.delay = delay
+        self.calls = 0
+
+    def quotes(self, instrument_tokens, quote_type):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.ltp is None:
+            raise ConnectionError("quote endpoint down")
+        return [{"ltp": str(self.ltp)}]
+
+
+def _burst(broker, symbol, n=5):
+    """Leader call plus n-1 followers that arrive while it is in flight"""
+    results = []
+    record = lambda: results.append(broker.get_current_price(symbol))
+    threads = [threading.Thread(target=record) for _ in range(n)]
+    threads[0].start()
+    time.sleep(0.05)
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_rest_quote_single_flight():
+    broker = KotakBroker(logger=logger)
+    broker.connected = True
+    broker.api = _SlowQuotes(ltp=123.5)
+    symbol = {"instrument_token": "111", "exchange_segment": "nse_fo"}
+
+    assert _burst(broker, symbol) == [123.5] * 5
+    assert broker.api.calls == 1
+
+
+def test_rest_follower_ignores_expired_quote():
+    broker = KotakBroker(logger=logger)
+    broker.connected = True
+    broker.api = _SlowQuotes(ltp=None)
+    broker._rest_quotes[111] = (99.0, time.monotonic() - 3600)  # hours-old REST quote
+    symbol = {"instrument_token": "111", "exchange_segment": "nse_fo"}
+
+    assert _burst(broker, symbol) == [None] * 5  # leader failed, no WS tick: nothing fresh
+    assert broker.api.calls == 1
+
+
+def test_full_tick_queue_sheds_oldest_frame():
+    broker = KotakBroker(logger=logger)
+    broker._tick_q = queue.Queue(maxsize=3)  # no consumer running: the queue fills up
+    for i in range(5):
+        broker._process_ticks([{"tk": "111", "ltp": str(100 + i), "v": "1"}])
+
+    assert broker._dropped_frames == 2
+    queued = [broker._tick_q.get_nowait()[1] for _ in range(3)]
+    assert queued == [[102.0], [103.0], [104.0]]  # newest frames kept, in order
+    assert broker.ltp_cache.get(111) == 104.0  # LTP cache never waits on the queue
+
+
+if __name__ == "__main__":
+    test_token_map_save_merges_instances()
+    test_ltp_cache_reads_do_not_reorder()
+    test_rest_quote_single_flight()
+    test_rest_follower_ignores_expired_quote()
+    test_full_tick_queue_sheds_oldest_frame()
+    logger.info(" Kotak cache checks passed")
@@ -0,0 +1,53 @@
+import os
+import logging
+from src.db.mongodb_handler import MongoDBHandler
+
+# Offline check of the queued system_config upserts (no Atlas connection)
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _FlakyCollection:
+    """bulk_write fails `failures` times, then records the ops"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.writes = []
+
+    def bulk_write(self, ops, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("network down")
+        self.writes.append(ops)
+
+
+def _handler(collection):
+    os.environ.pop("MONGODB_URI", None)
+    os.environ.pop("MONGO_URI", None)
+    handler = MongoDBHandler()
+    handler.connected = True
+    handler.db = {"system_config": collection}
+    return handler
+
+
+def test_failed_flush_requeues_updates():
+    collection = _FlakyCollection(failures=1)
+    handler = _handler(collection)
+    handler.queue_session_update("fyers_session", {"access_token": "a1", "updated_at": "t1"}, delay=60)
+
+    assert not handler.flush_session_updates()
+    assert handler._pending_session_updates["fyers_session"]["access_token"] == "a1"
+
+    # A newer update queued before the retry wins over the re-queued one
+    handler.queue_session_update("fyers_session", {"access_token": "a2"}, delay=60)
+    assert handler.flush_session_updates()
+    assert not handler._pending_session_updates
+
+    (ops,) = collection.writes
+    fields = ops[0]._doc["$set"]
+    assert fields == {"access_token": "a2", "updated_at": "t1"}
+
+
+if __name__ == "__main__":
+    test_failed_flush_requeues_updates()
+    logger.info(" MongoDB session queue check passed")